@@ -0,0 +1,213 @@
+import bisect
+import heapq
+import itertools
+import math
+import threading
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from evaluation_system import RunningStats
+from warmup import content_version
+from config import AnomalyConfig, anomaly_config
+
+BASELINE_DIMENSIONS = ['Operator', 'BU', 'Service']
+
+# metric -> (column, direction, use absolute value, unit); direction 1 means high values are bad.
+METRICS = {
+    'wait_time': ('Wait Time (Hours): ATB-BTR', 1, True, 'h'),
+    'berth_time': ('Berth Time (hours): ATU - ATB', 1, False, 'h'),
+    'bunker_saved': ('Bunker Saved (USD)', -1, False, ' USD'),
+    'carbon_abatement': ('Carbon Abatement (Tonnes)', -1, False, 't')
+}
+
+CALL_KEY_COLUMNS = ['Rotation No.', 'Vessel', 'ATB (Local Time)']
+
+class P2Quantile:
+    # Jain & Chlamtac P-square estimator: five markers, constant memory and time per value.
+    def __init__(self, p: float):
+        self.p = p
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        self.count += 1
+        if self.count <= 5:
+            bisect.insort(self.heights, x)
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                candidate = self._parabolic(i, step)
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = candidate
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> float:
+        if not self.heights:
+            return math.nan
+        if self.count <= 5:
+            return self.heights[min(len(self.heights) - 1, int(round(self.p * (len(self.heights) - 1))))]
+        return self.heights[2]
+
+class Baseline:
+    __slots__ = ('stats', 'tail')
+
+    def __init__(self, tail_quantile: float):
+        self.stats = RunningStats()
+        self.tail = P2Quantile(tail_quantile)
+
+    def add(self, value: float):
+        self.stats.add(value)
+        self.tail.add(value)
+
+class AnomalyDetector:
+    def __init__(self, config: Optional[AnomalyConfig] = None):
+        self.config = config or anomaly_config
+        self.baselines: Dict[Tuple[str, str, str], Baseline] = {}
+        self.version: Optional[str] = None
+        self._seen = set()
+        self._anomalies: List[Tuple[float, int, Dict]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Held for a whole sync; per-call updates take _lock so readers are not
+        # blocked while a new dataset is replayed.
+        self._sync_lock = threading.Lock()
+        self.stats = {'calls': 0, 'flagged': 0, 'syncs': 0}
+
+    def _baseline(self, dimension: str, key: str, metric: str) -> Baseline:
+        baseline = self.baselines.get((dimension, key, metric))
+        if baseline is None:
+            _, direction, _, _ = METRICS[metric]
+            tail = self.config.tail_quantile if direction > 0 else 1 - self.config.tail_quantile
+            baseline = self.baselines[(dimension, key, metric)] = Baseline(tail)
+        return baseline
+
+    def _score(self, baseline: Baseline, value: float, direction: int) -> Optional[Tuple[float, float]]:
+        stats = baseline.stats
+        if stats.count < self.config.min_samples:
+            return None
+        std = stats.std
+        z = direction * (value - stats.mean) / std if std > 0 else 0.0
+        threshold = baseline.tail.value()
+        if z >= self.config.z_threshold or direction * (value - threshold) > 0:
+            return z, threshold
+        return None
+
+    def observe(self, call: Dict) -> List[Dict]:
+        # Score against the baselines first, then learn from the call, so each
+        # call is judged only by the history that came before it.
+        with self._lock:
+            return self._observe(call)
+
+    def _observe(self, call: Dict) -> List[Dict]:
+        self.stats['calls'] += 1
+        keys = [(dim, str(call[dim])) for dim in BASELINE_DIMENSIONS if pd.notna(call.get(dim))]
+        found = []
+
+        for metric, (column, direction, absolute, unit) in METRICS.items():
+            value = pd.to_numeric(call.get(column), errors='coerce')
+            if pd.isna(value):
+                continue
+            value = abs(float(value)) if absolute else float(value)
+
+            worst = None
+            for dimension, key in keys:
+                baseline = self._baseline(dimension, key, metric)
+                scored = self._score(baseline, value, direction)
+                if scored is not None and (worst is None or scored[0] > worst[0]):
+                    worst = (scored[0], scored[1], f"{dimension} {key}", baseline.stats.mean)
+                baseline.add(value)
+
+            if worst is not None:
+                found.append({
+                    'metric': metric,
+                    'value': round(value, 2),
+                    'unit': unit,
+                    'score': round(worst[0], 2),
+                    'threshold': round(worst[1], 2),
+                    'typical': round(worst[3], 2),
+                    'baseline': worst[2],
+                    'vessel': call.get('Vessel'),
+                    'operator': call.get('Operator'),
+                    'bu': call.get('BU'),
+                    'rotation': call.get('Rotation No.'),
+                    'atb': call.get('ATB (Local Time)')
+                })
+
+        for anomaly in found:
+            entry = (anomaly['score'], next(self._sequence), anomaly)
+            if len(self._anomalies) < self.config.max_anomalies:
+                heapq.heappush(self._anomalies, entry)
+            else:
+                heapq.heappushpop(self._anomalies, entry)
+        self.stats['flagged'] += len(found)
+        return found
+
+    def sync(self, df: pd.DataFrame, version: Optional[str] = None) -> int:
+        version = version or df.attrs.get('dataset_version') or content_version(df)
+        with self._sync_lock:
+            if version == self.version:
+                return 0
+
+            key_columns = [c for c in CALL_KEY_COLUMNS if c in df.columns]
+            call_keys = list(df[key_columns].itertuples(index=False, name=None))
+            new_rows, current = [], set()
+            for i, key in enumerate(call_keys):
+                if key not in self._seen and key not in current:
+                    new_rows.append(i)
+                current.add(key)
+            # Only calls still in the dataset can reappear, so older keys are dropped.
+            self._seen = current
+
+            if new_rows:
+                calls = df.iloc[new_rows]
+                if 'ATB (Local Time)' in calls.columns:
+                    arrival = pd.to_datetime(calls['ATB (Local Time)'], errors='coerce')
+                    calls = calls.iloc[arrival.argsort(kind='stable')]
+                for call in calls.to_dict('records'):
+                    self.observe(call)
+
+            with self._lock:
+                self.version = version
+                self.stats['syncs'] += 1
+            return len(new_rows)
+
+    def top_anomalies(self, n: int = 5, operators: Optional[List[str]] = None,
+                      metric: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            ranked = sorted(self._anomalies, reverse=True)
+        return [
+            anomaly for _, _, anomaly in ranked
+            if (not operators or anomaly['operator'] in operators) and (metric is None or anomaly['metric'] == metric)
+        ][:n]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, baselines=len(self.baselines), retained=len(self._anomalies), version=self.version)
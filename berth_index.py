@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from warmup import content_version
+
+# Everything BerthIndex reads, so paged readers can build it from a narrow fetch.
+INDEX_COLUMNS = ['BU', 'Berth Status', 'Final BTR (Local Time)', 'ATB (Local Time)', 'ATU (Local Time)']
+
+OPEN_END = np.iinfo(np.int64).max
+NAT = np.iinfo(np.int64).min
+
+def _to_ns(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values), errors='coerce').to_numpy('datetime64[ns]').astype(np.int64)
+
+class IntervalSet:
+    # Half-open [start, end) intervals kept three ways: sorted starts and sorted ends
+    # for O(log n) counts, a max-end segment tree over the start order for overlap
+    # reporting, and the sweep-line step function for peak windows.
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, rows: np.ndarray):
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.ends = ends[order]
+        self.rows = rows[order]
+        self.sorted_ends = np.sort(ends)
+
+        size = 1
+        while size < max(1, len(self.starts)):
+            size *= 2
+        self._size = size
+        self._tree = np.full(2 * size, NAT, dtype=np.int64)
+        self._tree[size:size + len(self.ends)] = self.ends
+        level = size
+        while level > 1:
+            self._tree[level // 2:level] = np.maximum(self._tree[level:2 * level:2], self._tree[level + 1:2 * level:2])
+            level //= 2
+
+        times = np.concatenate([self.starts, self.ends])
+        deltas = np.concatenate([np.ones(len(self.starts), dtype=np.int64), -np.ones(len(self.ends), dtype=np.int64)])
+        sweep = np.lexsort((deltas, times))
+        self.step_times = times[sweep]
+        self.step_counts = np.cumsum(deltas[sweep])
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def count_at(self, t: int) -> int:
+        return int(np.searchsorted(self.starts, t, 'right') - np.searchsorted(self.sorted_ends, t, 'right'))
+
+    def counts_at(self, times: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.starts, times, 'right') - np.searchsorted(self.sorted_ends, times, 'right')
+
+    def count_overlapping(self, start: int, end: int) -> int:
+        return int(np.searchsorted(self.starts, end, 'left') - np.searchsorted(self.sorted_ends, start, 'right'))
+
+    def overlapping(self, start: int, end: int) -> List[int]:
+        limit = int(np.searchsorted(self.starts, end, 'left'))
+        found = []
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, lo, hi = stack.pop()
+            if lo >= limit or self._tree[node] <= start:
+                continue
+            if hi - lo == 1:
+                found.append(int(self.rows[lo]))
+                continue
+            mid = (lo + hi) // 2
+            stack.append((2 * node + 1, mid, hi))
+            stack.append((2 * node, lo, mid))
+        return found
+
+    def peak(self) -> int:
+        return int(self.step_counts.max()) if len(self.step_counts) else 0
+
+    def peak_windows(self, n: int = 3) -> List[Tuple[int, int, int]]:
+        if len(self.step_times) < 2:
+            return []
+        starts, ends, counts = self.step_times[:-1], self.step_times[1:], self.step_counts[:-1]
+        keep = ends > starts
+        starts, ends, counts = starts[keep], ends[keep], counts[keep]
+        order = np.lexsort((starts - ends, -counts))[:n]
+        return [(int(starts[i]), int(ends[i]), int(counts[i])) for i in order]
+
+class BerthIndex:
+    def __init__(self, df: pd.DataFrame, version: Optional[str] = None):
+        self.version = version or df.attrs.get('dataset_version') or content_version(df)
+        btr = _to_ns(df['Final BTR (Local Time)']) if 'Final BTR (Local Time)' in df.columns else None
+        atb = _to_ns(df['ATB (Local Time)'])
+        atu = _to_ns(df['ATU (Local Time)'])
+
+        still_alongside = (df['Berth Status'] == 'Alongside').to_numpy() if 'Berth Status' in df.columns \
+            else np.zeros(len(df), dtype=bool)
+        atu = np.where((atu == NAT) & still_alongside, OPEN_END, atu)
+
+        self.alongside: Dict[str, IntervalSet] = {}
+        self.waiting: Dict[str, IntervalSet] = {}
+        rows = np.arange(len(df))
+        bus = df['BU'].astype(str).to_numpy()
+
+        for bu in pd.unique(bus):
+            in_bu = bus == bu
+            berthed = in_bu & (atb != NAT) & (atu != NAT) & (atu > atb)
+            self.alongside[bu] = IntervalSet(atb[berthed], atu[berthed], rows[berthed])
+            if btr is not None:
+                waited = in_bu & (btr != NAT) & (atb != NAT) & (atb > btr)
+                self.waiting[bu] = IntervalSet(btr[waited], atb[waited], rows[waited])
+
+    def _set(self, bu: str, kind: str) -> Optional[IntervalSet]:
+        return (self.alongside if kind == 'alongside' else self.waiting).get(bu)
+
+    def vessels_at(self, bu: str, t) -> Dict[str, int]:
+        t = pd.Timestamp(t).value
+        alongside, waiting = self._set(bu, 'alongside'), self._set(bu, 'waiting')
+        return {
+            'alongside': alongside.count_at(t) if alongside is not None else 0,
+            'waiting': waiting.count_at(t) if waiting is not None else 0
+        }
+
+    def count_overlapping(self, bu: str, start, end, kind: str = 'alongside') -> int:
+        intervals = self._set(bu, kind)
+        if intervals is None:
+            return 0
+        return intervals.count_overlapping(pd.Timestamp(start).value, pd.Timestamp(end).value)
+
+    def overlapping_calls(self, bu: str, start, end, kind: str = 'alongside') -> List[int]:
+        intervals = self._set(bu, kind)
+        if intervals is None:
+            return []
+        return sorted(intervals.overlapping(pd.Timestamp(start).value, pd.Timestamp(end).value))
+
+    def peak_windows(self, bu: str, n: int = 3, kind: str = 'alongside') -> List[Dict]:
+        intervals = self._set(bu, kind)
+        if intervals is None:
+            return []
+        return [
+            {'start': pd.Timestamp(start), 'end': pd.Timestamp(end) if end != OPEN_END else None, 'vessels': count}
+            for start, end, count in intervals.peak_windows(n)
+        ]
+
+    def congestion_at_arrival(self, df: pd.DataFrame) -> np.ndarray:
+        # Share of the BU's peak berth occupancy in use when each call berthed.
+        atb = _to_ns(df['ATB (Local Time)'])
+        bus = df['BU'].astype(str).to_numpy()
+        congestion = np.full(len(df), np.nan)
+        for bu, intervals in self.alongside.items():
+            peak = intervals.peak()
+            in_bu = (bus == bu) & (atb != NAT)
+            if peak and in_bu.any():
+                congestion[in_bu] = np.round(intervals.counts_at(atb[in_bu]) / peak, 3)
+        return congestion
+
+    def summary(self, bus: Optional[List[str]] = None, top: int = 3) -> str:
+        if not bus:
+            bus = sorted(self.alongside, key=lambda bu: -self.alongside[bu].peak())[:top]
+
+        lines = []
+        for bu in bus:
+            alongside = self.alongside.get(bu)
+            if alongside is None:
+                continue
+            waiting = self._set(bu, 'waiting')
+            windows = self.peak_windows(bu, 1)
+            line = f"- {bu}: peak {alongside.peak()} vessels alongside"
+            if windows:
+                line += f" ({windows[0]['start']:%Y-%m-%d %H:%M} to {windows[0]['end']:%Y-%m-%d %H:%M})" \
+                    if windows[0]['end'] is not None else f" (since {windows[0]['start']:%Y-%m-%d %H:%M})"
+            if waiting is not None:
+                line += f", peak {waiting.peak()} waiting for berth"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def get_stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'business_units': len(self.alongside),
+            'alongside_intervals': sum(len(s) for s in self.alongside.values()),
+            'waiting_intervals': sum(len(s) for s in self.waiting.values())
+        }
+
+def add_berth_congestion(df: pd.DataFrame, index: Optional[BerthIndex] = None) -> BerthIndex:
+    # Shared preprocessing for every path that scores calls, so the risk
+    # penalty for congested berths applies the same in chat, service and planner.
+    index = index or BerthIndex(df)
+    df['Berth_Congestion'] = index.congestion_at_arrival(df)
+    return index
@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+import os
+from dataclasses import dataclass, field
 from typing import Dict
 
 @dataclass
@@ -9,6 +10,8 @@ class PowerBIConfig:
     workspace_id: str = "41675240-7b6e-4163-a0ed-52b5c3b13e01"
     report_id: str = "06bdda3d-459c-4632-8784-d43e6b208aab"
     authority_url: str = "https://login.microsoftonline.com"
+    api_base_url: str = "https://api.powerbi.com/v1.0/myorg"
+    use_msal: bool = True
     scope: list = None
     
     def __post_init__(self):
@@ -23,6 +26,20 @@ class AzureGPTConfig:
     api_version: str = "2025-01-01-preview"
     temperature: float = 0.7
     max_tokens: int = 1500
+    request_timeout_seconds: float = 30.0
+    deadline_seconds: float = 20.0
+    hedge_percentile: float = 95.0
+    hedge_delay_seconds: float = 4.0
+    hedge_min_samples: int = 20
+    max_attempts: int = 2
+    retry_backoff_seconds: float = 0.25
+    # Part of the deadline kept back so a fallback answer still arrives within it.
+    fallback_margin_seconds: float = 1.0
+    # Callers expected at once (service workers, load-test users); each may run max_attempts requests.
+    max_concurrent_calls: int = 32
+    batch_size: int = 20
+    batch_entity_tokens: int = 120
+    batch_retries: int = 2
 
 @dataclass
 class DecisionWeights:
@@ -43,6 +60,82 @@ class DecisionWeights:
                     "environmental_impact": 0.1, "risk_level": 0.4}
         return self.__dict__
 
+@dataclass
+class StandInConfig:
+    url: str = field(default_factory=lambda: os.environ.get("PRAXIS_STANDIN_URL", ""))
+    mode: str = "replay"
+    cassette_dir: str = "data/standin"
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_limit_ratio: float = 0.0
+    retry_after_seconds: int = 1
+    result_rows: int = 300
+    stream_chunk_ms: float = 0.0
+    json_omit_every: int = 0
+    seed: int = 404
+    
+    def apply(self, pbi: PowerBIConfig, gpt: AzureGPTConfig):
+        url = self.url.rstrip('/')
+        pbi.authority_url = url
+        pbi.api_base_url = f"{url}/v1.0/myorg"
+        pbi.use_msal = False
+        gpt.endpoint = f"{url}/"
+
+@dataclass
+class QueryServiceConfig:
+    host: str = "127.0.0.1"
+    port: int = 8600
+    workers: int = 8
+    queue_size: int = 32
+    request_timeout_seconds: float = 45.0
+    retry_after_seconds: int = 2
+    data_refresh_seconds: float = 60.0
+
+@dataclass
+class WarmupConfig:
+    enabled: bool = True
+    top_k: int = 20
+    pregenerate_narratives: bool = False
+
+@dataclass
+class SessionConfig:
+    max_sessions: int = 500
+    idle_ttl_seconds: float = 1800.0
+    spill_path: str = ""
+    spill_ttl_seconds: float = 7 * 24 * 3600.0
+
+@dataclass
+class AnomalyConfig:
+    z_threshold: float = 3.0
+    tail_quantile: float = 0.99
+    min_samples: int = 30
+    max_anomalies: int = 200
+
+@dataclass
+class MemoryConfig:
+    profile: bool = os.environ.get("PRAXIS_MEMORY_PROFILE", "") == "1"
+    budget_mb: float = 3072.0
+    analysis_overhead: float = 1.5
+    chunk_rows: int = 5000
+    # In-memory size of one 'Data' row, used to size a download before it starts.
+    row_bytes: int = 1024
+    snapshot_top: int = 0
+
+@dataclass
+class PlannerConfig:
+    # Batched operator/BU narratives cost LLM calls on every planner run, so they are opt-in.
+    narratives: bool = field(default_factory=lambda: os.environ.get("PRAXIS_PLANNER_NARRATIVES", "") == "1")
+
 powerbi_config = PowerBIConfig()
 gpt_config = AzureGPTConfig()
-decision_weights = DecisionWeights()
\ No newline at end of file
+decision_weights = DecisionWeights()
+standin_config = StandInConfig()
+service_config = QueryServiceConfig()
+warmup_config = WarmupConfig()
+session_config = SessionConfig()
+anomaly_config = AnomalyConfig()
+memory_config = MemoryConfig()
+planner_config = PlannerConfig()
+
+if standin_config.url:
+    standin_config.apply(powerbi_config, gpt_config)
\ No newline at end of file
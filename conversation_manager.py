@@ -1,10 +1,14 @@
 from typing import List, Dict, Optional
 from datetime import datetime
+from collections import deque
 import json
 
+PARETO_KEYWORDS = ['pareto', 'dominated', 'trade-off', 'tradeoff', 'skyline', 'frontier']
+
 class ConversationManager:
     def __init__(self):
-        self.history: List[Dict] = []
+        self.max_history = 10
+        self.history: deque = deque(maxlen=self.max_history)
         self.context = {
             'user_focus': [],
             'operators_mentioned': set(),
@@ -12,7 +16,6 @@ class ConversationManager:
             'current_topic': None,
             'decision_context': {}
         }
-        self.max_history = 10
         
     def add_message(self, role: str, content: str, metadata: Optional[Dict] = None):
         message = {
@@ -24,9 +27,6 @@ class ConversationManager:
         
         self.history.append(message)
         
-        if len(self.history) > self.max_history:
-            self.history = self.history[-self.max_history:]
-        
         if role == 'user':
             self._update_context(content)
     
@@ -50,11 +50,14 @@ class ConversationManager:
                 self.context['current_topic'] = topic
                 break
     
+    def mention_vessels(self, vessels: List[str]):
+        self.context['vessels_mentioned'].update(vessels)
+    
     def get_conversation_context(self) -> str:
         if not self.history:
             return ""
         
-        recent = self.history[-3:]
+        recent = list(self.history)[-3:]
         context_str = "Recent conversation:\n"
         
         for msg in recent:
@@ -63,6 +66,9 @@ class ConversationManager:
         if self.context['operators_mentioned']:
             context_str += f"\nOperators discussed: {', '.join(self.context['operators_mentioned'])}\n"
         
+        if self.context['vessels_mentioned']:
+            context_str += f"Vessels discussed: {', '.join(sorted(self.context['vessels_mentioned']))}\n"
+        
         if self.context['current_topic']:
             context_str += f"Current topic: {self.context['current_topic']}\n"
         
@@ -73,7 +79,9 @@ class ConversationManager:
             'type': 'general',
             'entities': {
                 'operators': [],
+                'vessels': [],
                 'comparison': False,
+                'pareto': False,
                 'time_period': None
             },
             'requires_data': True
@@ -84,8 +92,9 @@ class ConversationManager:
         if any(word in user_lower for word in ['compare', 'versus', 'vs', 'between', 'difference']):
             intent['type'] = 'comparison'
             intent['entities']['comparison'] = True
-        elif any(word in user_lower for word in ['top', 'best', 'worst', 'rank']):
+        elif any(word in user_lower for word in ['top', 'best', 'worst', 'rank'] + PARETO_KEYWORDS):
             intent['type'] = 'ranking'
+            intent['entities']['pareto'] = any(word in user_lower for word in PARETO_KEYWORDS)
         elif any(word in user_lower for word in ['predict', 'forecast', 'expect', 'will']):
             intent['type'] = 'prediction'
         elif any(word in user_lower for word in ['recommend', 'suggest', 'should', 'advice']):
@@ -128,7 +137,7 @@ Keep response concise and focused."""
         return prompt
     
     def clear_context(self):
-        self.history = []
+        self.history = deque(maxlen=self.max_history)
         self.context = {
             'user_focus': [],
             'operators_mentioned': set(),
@@ -138,4 +147,20 @@ Keep response concise and focused."""
         }
     
     def export_conversation(self) -> str:
-        return json.dumps(self.history, indent=2)
\ No newline at end of file
+        return json.dumps(list(self.history), indent=2)
+    
+    def to_dict(self) -> Dict:
+        context = dict(self.context)
+        context['operators_mentioned'] = sorted(self.context['operators_mentioned'])
+        context['vessels_mentioned'] = sorted(self.context['vessels_mentioned'])
+        return {'history': list(self.history), 'context': context}
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'ConversationManager':
+        conv_mgr = cls()
+        conv_mgr.history.extend(data.get('history', []))
+        context = data.get('context', {})
+        conv_mgr.context.update(context)
+        conv_mgr.context['operators_mentioned'] = set(context.get('operators_mentioned', []))
+        conv_mgr.context['vessels_mentioned'] = set(context.get('vessels_mentioned', []))
+        return conv_mgr
\ No newline at end of file
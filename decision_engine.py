@@ -1,10 +1,54 @@
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from config import decision_weights
 
+TOP_PERFORMER_COLUMNS = ['Operator', 'Vessel', 'DIS_Score', 'Time_Efficiency',
+                         'Cost_Efficiency', 'Environmental_Score', 'Risk_Score']
+PARETO_COLUMNS = ['Time_Efficiency', 'Cost_Efficiency', 'Environmental_Score', 'Risk_Score']
+
+def non_dominated_ranks(points: np.ndarray) -> np.ndarray:
+    # Efficient non-dominated sort with binary search: after a descending
+    # lexicographic sort a point can only be dominated by points placed before it,
+    # and if front k dominates it so does every earlier front, so each point is
+    # tested against O(log fronts) fronts. Each test still scans that front's
+    # members, so the worst case (one wide front) stays O(n^2) comparisons; the
+    # answer cache runs it in the background warm-up, never per request.
+    # Identical points share a rank, so only distinct points are sorted.
+    if len(points) == 0:
+        return np.zeros(0, dtype=int)
+    unique, inverse = np.unique(points, axis=0, return_inverse=True)
+    ranks = np.zeros(len(unique), dtype=int)
+    fronts: List[np.ndarray] = []
+    sizes: List[int] = []
+    for i in range(len(unique) - 1, -1, -1):
+        # np.unique sorts lexicographically, so walking backwards visits points
+        # in descending order and earlier members are >= on the first objective.
+        tail = unique[i, 1:]
+        lo, hi = 0, len(fronts)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (fronts[mid][:sizes[mid]] >= tail).all(axis=1).any():
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(fronts):
+            fronts.append(np.empty((16, len(tail))))
+            sizes.append(0)
+        elif sizes[lo] == len(fronts[lo]):
+            fronts[lo] = np.concatenate([fronts[lo], np.empty_like(fronts[lo])])
+        fronts[lo][sizes[lo]] = tail
+        sizes[lo] += 1
+        ranks[i] = lo + 1
+    return ranks[inverse.ravel()]
+
 class DecisionEngine:
     def __init__(self, strategy_priority: str = "balanced"):
+        self.strategy = strategy_priority
+        self.weights = decision_weights.update_for_strategy(strategy_priority)
+    
+    def set_strategy(self, strategy_priority: str):
+        self.strategy = strategy_priority
         self.weights = decision_weights.update_for_strategy(strategy_priority)
         
     def calculate_time_efficiency(self, row: pd.Series) -> float:
@@ -33,6 +77,8 @@ class DecisionEngine:
             risk_score -= 20
         if row['Arrival Accuracy (Final BTR)'] == 'N':
             risk_score -= 30
+        if row.get('Berth_Congestion', 0) >= 0.8:
+            risk_score -= 10
             
         return max(0, risk_score)
     
@@ -51,6 +97,21 @@ class DecisionEngine:
         
         return round(dis, 2)
     
+    def explain_dis(self, row: pd.Series) -> Dict:
+        components = {
+            'time_efficiency': self.calculate_time_efficiency(row),
+            'cost_efficiency': self.calculate_cost_efficiency(row),
+            'environmental_impact': self.calculate_environmental_impact(row),
+            'risk_level': self.calculate_risk_level(row)
+        }
+        
+        return {
+            'dis': float(self.calculate_dis(row)),
+            'components': {name: round(float(score), 2) for name, score in components.items()},
+            'weights': {name: self.weights[name] for name in components},
+            'contributions': {name: round(float(score) * self.weights[name], 2) for name, score in components.items()}
+        }
+    
     def analyze_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
         df['DIS_Score'] = df.apply(self.calculate_dis, axis=1)
         df['Time_Efficiency'] = df.apply(self.calculate_time_efficiency, axis=1)
@@ -59,12 +120,69 @@ class DecisionEngine:
         df['Risk_Score'] = df.apply(self.calculate_risk_level, axis=1)
         return df
     
+    def analyze_pages(self, pages: Iterable[pd.DataFrame], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        # Pages are scored and trimmed to `columns` one at a time, so only the
+        # kept columns of earlier pages stay in memory.
+        chunks = []
+        for page in pages:
+            analyzed = self.analyze_dataframe(page)
+            chunks.append(analyzed[[col for col in columns if col in analyzed.columns]] if columns else analyzed)
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    
+    def rescore(self, analyzed: pd.DataFrame, weights: Dict[str, float]) -> pd.Series:
+        dis = (
+            analyzed['Time_Efficiency'] * weights['time_efficiency'] +
+            analyzed['Cost_Efficiency'] * weights['cost_efficiency'] +
+            analyzed['Environmental_Score'] * weights['environmental_impact'] +
+            analyzed['Risk_Score'] * weights['risk_level']
+        )
+        return dis.round(2)
+    
     def get_top_performers(self, df: pd.DataFrame, n: int = 5) -> pd.DataFrame:
         analyzed_df = self.analyze_dataframe(df)
-        return analyzed_df.nlargest(n, 'DIS_Score')[
-            ['Operator', 'Vessel', 'DIS_Score', 'Time_Efficiency', 
-             'Cost_Efficiency', 'Environmental_Score', 'Risk_Score']
-        ]
+        return analyzed_df.nlargest(n, 'DIS_Score')[TOP_PERFORMER_COLUMNS]
+    
+    def pareto_fronts(self, analyzed: pd.DataFrame, group_by: Optional[str] = None) -> pd.Series:
+        points = analyzed[PARETO_COLUMNS].to_numpy(dtype=float)
+        ranks = np.zeros(len(analyzed), dtype=int)
+        groups = analyzed.groupby(group_by).indices.values() if group_by else [np.arange(len(analyzed))]
+        for positions in groups:
+            ranks[positions] = non_dominated_ranks(points[positions])
+        return pd.Series(ranks, index=analyzed.index, name='Pareto_Rank')
+    
+    def pareto_front(self, analyzed: pd.DataFrame, n: int = 10, ranks: Optional[pd.Series] = None) -> pd.DataFrame:
+        ranks = self.pareto_fronts(analyzed) if ranks is None else ranks
+        return analyzed[ranks == 1].nlargest(n, 'DIS_Score')[TOP_PERFORMER_COLUMNS]
+    
+    def skyline_by(self, analyzed: pd.DataFrame, group_by: str = 'Operator') -> pd.DataFrame:
+        means = analyzed.groupby(group_by)[PARETO_COLUMNS + ['DIS_Score']].mean().round(2)
+        means['Pareto_Rank'] = non_dominated_ranks(means[PARETO_COLUMNS].to_numpy(dtype=float))
+        return means.sort_values(['Pareto_Rank', 'DIS_Score'], ascending=[True, False])
+    
+    def get_pareto_front(self, df: pd.DataFrame, n: int = 10) -> pd.DataFrame:
+        return self.pareto_front(self.analyze_dataframe(df), n)
+    
+    def summarize(self, analyzed: pd.DataFrame) -> Dict:
+        return {
+            'total_vessels': len(analyzed),
+            'avg_dis': round(analyzed['DIS_Score'].mean(), 2),
+            'avg_wait_time': round(analyzed['Wait Time (Hours): ATB-BTR'].mean(), 2),
+            'total_bunker_saved': round(analyzed['Bunker Saved (USD)'].sum(), 2),
+            'on_time_rate': round((analyzed['Arrival Accuracy (Final BTR)'] == 'Y').mean() * 100, 1)
+        }
+    
+    def entity_stats(self, analyzed: pd.DataFrame, group_by: str) -> Dict[str, Dict]:
+        grouped = analyzed.groupby(group_by)
+        on_time = (analyzed['Arrival Accuracy (Final BTR)'] == 'Y').groupby(analyzed[group_by]).mean()
+        stats = pd.DataFrame({
+            'calls': grouped.size(),
+            'avg_dis': grouped['DIS_Score'].mean().round(2),
+            'avg_wait_time': grouped['Wait Time (Hours): ATB-BTR'].mean().round(2),
+            'on_time_rate': (on_time * 100).round(1),
+            'total_bunker_saved': grouped['Bunker Saved (USD)'].sum().round(2),
+            'total_carbon_abatement': grouped['Carbon Abatement (Tonnes)'].sum().round(2)
+        })
+        return {str(entity): row for entity, row in stats.to_dict('index').items()}
     
     def compare_operators(self, df: pd.DataFrame, operators: List[str]) -> Dict:
         operator_data = df[df['Operator'].isin(operators)]
@@ -83,10 +201,27 @@ class DecisionEngine:
         
         return comparison
     
-    def generate_recommendations(self, df: pd.DataFrame, top_n: int = 3) -> List[str]:
-        analyzed = self.analyze_dataframe(df)
+    def generate_recommendations(self, df: pd.DataFrame, top_n: int = 3,
+                                 anomalies: Optional[List[Dict]] = None) -> List[str]:
+        return self.recommendations_from_analyzed(self.analyze_dataframe(df), top_n, anomalies)
+    
+    def outlier_recommendation(self, anomalies: List[Dict], top_n: int = 3) -> str:
+        details = []
+        for anomaly in anomalies[:top_n]:
+            metric = anomaly['metric'].replace('_', ' ')
+            details.append(
+                f"{anomaly['vessel']} ({anomaly['operator']}, {anomaly['bu']}) {metric} "
+                f"{anomaly['value']}{anomaly['unit']} vs typical {anomaly['typical']}{anomaly['unit']} for {anomaly['baseline']}"
+            )
+        return f"Review outlier calls: {'; '.join(details)}"
+    
+    def recommendations_from_analyzed(self, analyzed: pd.DataFrame, top_n: int = 3,
+                                      anomalies: Optional[List[Dict]] = None) -> List[str]:
         recommendations = []
         
+        if anomalies:
+            recommendations.append(self.outlier_recommendation(anomalies, top_n))
+        
         avg_wait_time = analyzed['Wait Time (Hours): ATB-BTR'].mean()
         if avg_wait_time > 5:
             recommendations.append(f"High average wait time ({avg_wait_time:.1f}h). Consider berth scheduling optimization.")
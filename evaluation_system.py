@@ -1,27 +1,161 @@
 import time
-from typing import Dict, List
+import itertools
+import threading
+from typing import Dict, List, Optional
 from datetime import datetime
-from collections import deque
+from collections import deque, OrderedDict
 
-class EvaluationSystem:
+class RunningStats:
     def __init__(self):
-        self.metrics = {
-            'response_times': deque(maxlen=100),
-            'query_count': 0,
-            'accuracy_scores': deque(maxlen=100),
-            'user_feedback': deque(maxlen=100)
-        }
-        self.session_start = datetime.now()
-        
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: 'RunningStats'):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self) -> float:
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
+
+class ShardedStats:
+    # Each writer thread is assigned a shard round-robin on first use, so concurrent
+    # script runs rarely share a lock; readers merge a fixed number of shards.
+    # (Thread idents are aligned addresses, so ident % n would map them all to shard 0.)
+    def __init__(self, shards: int = 16):
+        self._shards = [RunningStats() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self._local = threading.local()
+        self._next_shard = itertools.count()
+
+    def _shard(self) -> int:
+        i = getattr(self._local, 'shard', None)
+        if i is None:
+            i = self._local.shard = next(self._next_shard) % len(self._shards)
+        return i
+
+    def add(self, value: float):
+        i = self._shard()
+        with self._locks[i]:
+            self._shards[i].add(value)
+
+    def snapshot(self) -> RunningStats:
+        merged = RunningStats()
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                merged.merge(shard)
+        return merged
+
+class WindowedRate:
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self._counts = [0.0] * window_seconds
+        self._stamps = [-1] * window_seconds
+        self._lock = threading.Lock()
+
+    def add(self, amount: float = 1.0, now: Optional[float] = None):
+        second = int(now if now is not None else time.time())
+        i = second % self.window_seconds
+        with self._lock:
+            if self._stamps[i] != second:
+                self._stamps[i] = second
+                self._counts[i] = 0.0
+            self._counts[i] += amount
+
+    def total(self, now: Optional[float] = None) -> float:
+        oldest = int(now if now is not None else time.time()) - self.window_seconds
+        with self._lock:
+            return sum(c for c, s in zip(self._counts, self._stamps) if s > oldest)
+
+class RecentWindow:
+    def __init__(self, size: int = 10):
+        self._values = deque(maxlen=size)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, value: float):
+        with self._lock:
+            if len(self._values) == self._values.maxlen:
+                self._sum -= self._values[0]
+            self._values.append(value)
+            self._sum += value
+
+    def average(self) -> float:
+        with self._lock:
+            return self._sum / len(self._values) if self._values else 0.0
+
+class MetricsView:
+    def __init__(self):
+        self.response_times = ShardedStats()
+        self.ratings = ShardedStats()
+        self.tokens = ShardedStats()
+        self.recent = RecentWindow(10)
+        self.queries_per_min = WindowedRate(60)
+        self.tokens_per_min = WindowedRate(60)
+        self.started = datetime.now()
+
+    def record_query(self, response_time: float, tokens: int = 0):
+        now = time.time()
+        self.response_times.add(response_time)
+        self.recent.add(response_time)
+        self.queries_per_min.add(1, now)
+        if tokens:
+            self.tokens.add(tokens)
+            self.tokens_per_min.add(tokens, now)
+
+class EvaluationSystem:
+    def __init__(self, max_session_views: int = 1000):
+        self.max_session_views = max_session_views
+        self._views_lock = threading.Lock()
+        # Read-only stand-in for sessions with no queries yet, so polling them builds nothing.
+        self._empty_view = MetricsView()
+        self.reset_session()
+
     def start_query(self) -> float:
         return time.time()
-    
-    def end_query(self, start_time: float) -> float:
+
+    def _session_view(self, session_id: Optional[str]) -> Optional[MetricsView]:
+        if session_id is None:
+            return None
+        with self._views_lock:
+            view = self.session_views.get(session_id)
+            if view is None:
+                view = self.session_views[session_id] = MetricsView()
+                if len(self.session_views) > self.max_session_views:
+                    self.session_views.popitem(last=False)
+            else:
+                self.session_views.move_to_end(session_id)
+            return view
+
+    def end_query(self, start_time: float, session_id: Optional[str] = None, tokens: int = 0) -> float:
         response_time = time.time() - start_time
-        self.metrics['response_times'].append(response_time)
-        self.metrics['query_count'] += 1
+        self.global_view.record_query(response_time, tokens)
+        session_view = self._session_view(session_id)
+        if session_view is not None:
+            session_view.record_query(response_time, tokens)
         return response_time
-    
+
     def calculate_ciq(self, response_time: float, accuracy: float, actionability: float) -> float:
         speed_score = max(0, 100 - (response_time * 10))
         
@@ -32,58 +166,81 @@ class EvaluationSystem:
         )
         
         return round(ciq, 2)
-    
-    def add_feedback(self, rating: int, comment: str = ""):
-        self.metrics['user_feedback'].append({
+
+    def add_feedback(self, rating: int, comment: str = "", session_id: Optional[str] = None):
+        self.global_view.ratings.add(rating)
+        session_view = self._session_view(session_id)
+        if session_view is not None:
+            session_view.ratings.add(rating)
+        self._user_feedback.append({
             'rating': rating,
             'comment': comment,
             'timestamp': datetime.now().isoformat()
         })
-    
+
     def calculate_speedup(self, ai_time: float, manual_time: float = 300) -> float:
         return round(manual_time / ai_time, 2)
-    
-    def get_performance_summary(self) -> Dict:
-        if not self.metrics['response_times']:
-            return {'status': 'No data yet'}
+
+    def _view(self, session_id: Optional[str]) -> MetricsView:
+        if session_id is None:
+            return self.global_view
+        with self._views_lock:
+            return self.session_views.get(session_id, self._empty_view)
+
+    @property
+    def query_count(self) -> int:
+        return self.global_view.response_times.snapshot().count
+
+    @property
+    def metrics(self) -> Dict:
+        return {
+            'query_count': self.query_count,
+            'accuracy_scores': self._accuracy_scores,
+            'user_feedback': self._user_feedback
+        }
+
+    def get_performance_summary(self, session_id: Optional[str] = None) -> Dict:
+        view = self._view(session_id)
+        response_times = view.response_times.snapshot()
         
-        response_times = list(self.metrics['response_times'])
-        avg_response = sum(response_times) / len(response_times)
+        if response_times.count == 0:
+            return {'status': 'No data yet'}
         
         manual_baseline = 300
-        speedup = self.calculate_speedup(avg_response, manual_baseline)
+        speedup = self.calculate_speedup(response_times.mean, manual_baseline)
         
-        feedback_ratings = [f['rating'] for f in self.metrics['user_feedback']]
-        avg_rating = sum(feedback_ratings) / len(feedback_ratings) if feedback_ratings else 0
+        ratings = view.ratings.snapshot()
+        avg_rating = ratings.mean if ratings.count else 0
         
         return {
-            'total_queries': self.metrics['query_count'],
-            'avg_response_time': round(avg_response, 2),
-            'min_response_time': round(min(response_times), 2),
-            'max_response_time': round(max(response_times), 2),
+            'total_queries': response_times.count,
+            'avg_response_time': round(response_times.mean, 2),
+            'min_response_time': round(response_times.min, 2),
+            'max_response_time': round(response_times.max, 2),
+            'std_response_time': round(response_times.std, 2),
             'speedup_vs_manual': speedup,
             'avg_user_rating': round(avg_rating, 2),
-            'session_duration': str(datetime.now() - self.session_start).split('.')[0]
+            'total_tokens': int(view.tokens.snapshot().total),
+            'session_duration': str(datetime.now() - view.started).split('.')[0]
         }
-    
-    def get_real_time_metrics(self) -> Dict:
-        recent_times = list(self.metrics['response_times'])[-10:] if self.metrics['response_times'] else []
-        
-        if recent_times:
-            recent_avg = sum(recent_times) / len(recent_times)
-        else:
-            recent_avg = 0
+
+    def get_real_time_metrics(self, session_id: Optional[str] = None) -> Dict:
+        view = self._view(session_id)
+        query_count = view.response_times.snapshot().count
+        recent_avg = view.recent.average()
         
         time_saved = 0
-        if self.metrics['query_count'] > 0 and recent_avg > 0:
-            time_saved = round((300 - recent_avg) * self.metrics['query_count'] / 60, 1)
+        if query_count > 0 and recent_avg > 0:
+            time_saved = round((300 - recent_avg) * query_count / 60, 1)
         
         return {
             'last_10_avg_response': round(recent_avg, 2),
-            'queries_this_session': self.metrics['query_count'],
-            'estimated_time_saved': max(0, time_saved)
+            'queries_this_session': query_count,
+            'estimated_time_saved': max(0, time_saved),
+            'queries_per_min': round(view.queries_per_min.total(), 1),
+            'tokens_per_min': round(view.tokens_per_min.total(), 1)
         }
-    
+
     def evaluate_answer_quality(self, answer: str, has_metrics: bool, has_recommendations: bool) -> Dict:
         quality_score = 0
         
@@ -105,12 +262,11 @@ class EvaluationSystem:
             'has_recommendations': has_recommendations,
             'word_count': len(answer.split())
         }
-    
+
     def reset_session(self):
-        self.metrics = {
-            'response_times': deque(maxlen=100),
-            'query_count': 0,
-            'accuracy_scores': deque(maxlen=100),
-            'user_feedback': deque(maxlen=100)
-        }
-        self.session_start = datetime.now()
\ No newline at end of file
+        self._accuracy_scores = deque(maxlen=100)
+        self._user_feedback = deque(maxlen=100)
+        self.global_view = MetricsView()
+        with self._views_lock:
+            self.session_views: OrderedDict = OrderedDict()
+        self.session_start = self.global_view.started
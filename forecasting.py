@@ -0,0 +1,279 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from warmup import content_version
+
+DIMENSIONS = ['Operator', 'BU', 'Service']
+METRICS = ['wait_time', 'arrival_accuracy', 'berth_time']
+MODELS = ['ewma', 'linear', 'seasonal']
+# Periods outside this range are treated as missing so one garbage Year cannot
+# stretch the period axis (and the series matrix) over centuries.
+YEAR_RANGE = (1990, 2100)
+
+MONTH_NAMES = {name.lower(): i for i, name in enumerate(
+    ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+     'August', 'September', 'October', 'November', 'December'], 1)}
+MONTH_NAMES.update({name[:3]: i for name, i in list(MONTH_NAMES.items())})
+
+def _hours_between(later: pd.Series, earlier: pd.Series) -> pd.Series:
+    return (later - earlier).dt.total_seconds() / 3600
+
+def _timestamp(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+    return pd.to_datetime(df[column], errors='coerce')
+
+def _numeric(df: pd.DataFrame, column: str) -> pd.Series:
+    if column not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[column], errors='coerce')
+
+def period_index(df: pd.DataFrame) -> np.ndarray:
+    atb = _timestamp(df, 'ATB (Local Time)')
+    year = _numeric(df, 'Year').fillna(atb.dt.year)
+
+    month = _numeric(df, 'Month')
+    if 'Month' in df.columns and month.isna().any():
+        names = df['Month'].astype(str).str.strip().str.lower().map(MONTH_NAMES)
+        month = month.fillna(names)
+    month = month.fillna(atb.dt.month)
+
+    year = year.where(year.between(*YEAR_RANGE))
+    month = month.where(month.between(1, 12))
+    return (year * 12 + month - 1).to_numpy(dtype=float)
+
+def metric_values(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    btr = _timestamp(df, 'Final BTR (Local Time)')
+    atb = _timestamp(df, 'ATB (Local Time)')
+    atu = _timestamp(df, 'ATU (Local Time)')
+
+    wait = _hours_between(atb, btr).fillna(_numeric(df, 'Wait Time (Hours): ATB-BTR'))
+    berth = _hours_between(atu, atb).fillna(_numeric(df, 'Berth Time (hours): ATU - ATB'))
+
+    if 'Arrival Accuracy (Final BTR)' in df.columns:
+        flags = df['Arrival Accuracy (Final BTR)']
+        accuracy = (flags == 'Y').astype(float).where(flags.isin(['Y', 'N']))
+    else:
+        accuracy = pd.Series(np.nan, index=df.index)
+
+    return {
+        'wait_time': wait.to_numpy(dtype=float),
+        'arrival_accuracy': accuracy.to_numpy(dtype=float) * 100,
+        'berth_time': berth.to_numpy(dtype=float)
+    }
+
+def ewma_forecast(y: np.ndarray, alpha: float, steps: int) -> np.ndarray:
+    level = np.full(y.shape[0], np.nan)
+    for t in range(y.shape[1]):
+        column = y[:, t]
+        observed = ~np.isnan(column)
+        updated = np.where(np.isnan(level), column, alpha * column + (1 - alpha) * level)
+        level = np.where(observed, updated, level)
+    return np.repeat(level[:, None], steps, axis=1)
+
+def linear_forecast(y: np.ndarray, steps: int) -> np.ndarray:
+    t = np.arange(y.shape[1], dtype=float)
+    mask = ~np.isnan(y)
+    values = np.where(mask, y, 0.0)
+    n = mask.sum(axis=1)
+    sum_t = (mask * t).sum(axis=1)
+    sum_y = values.sum(axis=1)
+    sum_tt = (mask * t * t).sum(axis=1)
+    sum_ty = (values * t).sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sum_tt - sum_t ** 2
+        slope = np.where(denominator > 0, (n * sum_ty - sum_t * sum_y) / denominator, 0.0)
+        intercept = np.where(n > 0, (sum_y - slope * sum_t) / n, np.nan)
+
+    future_t = y.shape[1] - 1 + np.arange(1, steps + 1, dtype=float)
+    return intercept[:, None] + slope[:, None] * future_t[None, :]
+
+def _row_nanmean(values: np.ndarray) -> np.ndarray:
+    # np.nanmean warns on all-NaN rows, and silencing that needs process-global
+    # warning filters; averaging the observed cells directly gives NaN quietly.
+    observed = ~np.isnan(values)
+    counts = observed.sum(axis=1)
+    totals = np.where(observed, values, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+def seasonal_forecast(y: np.ndarray, first_period: int, steps: int) -> np.ndarray:
+    month_of_year = (first_period + np.arange(y.shape[1])) % 12
+    overall = _row_nanmean(y)
+    seasonal = np.full((y.shape[0], 12), np.nan)
+    for m in range(12):
+        seasonal[:, m] = _row_nanmean(y[:, month_of_year == m])
+
+    future_months = (first_period + y.shape[1] - 1 + np.arange(1, steps + 1)) % 12
+    forecast = seasonal[:, future_months]
+    return np.where(np.isnan(forecast), overall[:, None], forecast)
+
+class ForecastEngine:
+    def __init__(self, horizon: int = 3, ewma_alpha: float = 0.4, backtest_periods: int = 3,
+                 max_versions: int = 4):
+        self.horizon = horizon
+        self.ewma_alpha = ewma_alpha
+        self.backtest_periods = backtest_periods
+        self.max_versions = max_versions
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'fits': 0, 'hits': 0, 'last_fit_seconds': 0.0}
+
+    def _series_matrix(self, df: pd.DataFrame) -> Tuple[List[Tuple[str, str]], int, int, Dict[str, np.ndarray]]:
+        periods = period_index(df)
+        valid = ~np.isnan(periods)
+        first_period = int(np.nanmin(periods)) if valid.any() else 0
+        n_periods = int(np.nanmax(periods)) - first_period + 1 if valid.any() else 0
+        period_pos = np.where(valid, periods - first_period, 0).astype(int)
+
+        keys = [('ALL', 'ALL')]
+        row_series = [np.zeros(len(df), dtype=int)]
+        for dimension in DIMENSIONS:
+            if dimension not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[dimension])
+            offset = len(keys)
+            keys.extend((dimension, str(value)) for value in uniques)
+            row_series.append(np.where(codes >= 0, codes + offset, -1))
+
+        values = metric_values(df)
+        matrices = {}
+        for metric, metric_values_ in values.items():
+            sums = np.zeros((len(keys), n_periods))
+            counts = np.zeros((len(keys), n_periods))
+            for series in row_series:
+                mask = valid & (series >= 0) & ~np.isnan(metric_values_)
+                np.add.at(sums, (series[mask], period_pos[mask]), metric_values_[mask])
+                np.add.at(counts, (series[mask], period_pos[mask]), 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                matrices[metric] = np.where(counts > 0, sums / counts, np.nan)
+            matrices[f"{metric}_counts"] = counts
+
+        return keys, first_period, n_periods, matrices
+
+    def _predict(self, y: np.ndarray, first_period: int, steps: int) -> np.ndarray:
+        return np.stack([
+            ewma_forecast(y, self.ewma_alpha, steps),
+            linear_forecast(y, steps),
+            seasonal_forecast(y, first_period, steps)
+        ])
+
+    def fit(self, df: pd.DataFrame) -> Dict:
+        start = time.perf_counter()
+        keys, first_period, n_periods, matrices = self._series_matrix(df)
+        rows = np.arange(len(keys))
+        result = {
+            'keys': keys,
+            'index': {key: i for i, key in enumerate(keys)},
+            'periods': [self._label(first_period + n_periods - 1 + h) for h in range(1, self.horizon + 1)],
+            'metrics': {}
+        }
+
+        for metric in METRICS:
+            y = matrices[metric]
+            forecasts = self._predict(y, first_period, self.horizon)
+
+            # One-step backtests over the latest periods pick a model per series.
+            error_sum = np.zeros((len(MODELS), len(keys)))
+            error_count = np.zeros((len(MODELS), len(keys)))
+            for holdout in range(1, min(self.backtest_periods, n_periods - 2) + 1):
+                cut = n_periods - holdout
+                predicted = self._predict(y[:, :cut], first_period, 1)[:, :, 0]
+                actual = y[:, cut]
+                valid = ~np.isnan(predicted) & ~np.isnan(actual)[None, :]
+                error_sum += np.where(valid, np.abs(predicted - actual[None, :]), 0.0)
+                error_count += valid
+            with np.errstate(divide='ignore', invalid='ignore'):
+                errors = np.where(error_count > 0, error_sum / error_count, np.inf)
+            chosen = np.argmin(errors, axis=0)
+            chosen = np.where(np.isinf(errors.min(axis=0)), 0, chosen)
+
+            forecast = forecasts[chosen, rows, :]
+            if metric == 'arrival_accuracy':
+                forecast = np.clip(forecast, 0, 100)
+
+            observed = ~np.isnan(y)
+            last_index = np.where(observed.any(axis=1), n_periods - 1 - np.argmax(observed[:, ::-1], axis=1), -1)
+            last_value = np.where(last_index >= 0, y[rows, np.maximum(last_index, 0)], np.nan)
+
+            result['metrics'][metric] = {
+                'forecast': forecast,
+                'model': np.array(MODELS)[chosen],
+                'backtest_error': errors[chosen, rows],
+                'last_value': last_value,
+                'observations': matrices[f"{metric}_counts"].sum(axis=1).astype(int),
+                'periods_observed': observed.sum(axis=1)
+            }
+
+        self.stats['fits'] += 1
+        self.stats['last_fit_seconds'] = round(time.perf_counter() - start, 4)
+        return result
+
+    def _label(self, period: int) -> str:
+        return f"{period // 12}-{period % 12 + 1:02d}"
+
+    def get_forecasts(self, df: pd.DataFrame, version: Optional[str] = None) -> Dict:
+        version = version or df.attrs.get('dataset_version') or content_version(df)
+        with self._lock:
+            if version in self._cache:
+                self._cache.move_to_end(version)
+                self.stats['hits'] += 1
+                return self._cache[version]
+
+        result = self.fit(df)
+        with self._lock:
+            self._cache[version] = result
+            while len(self._cache) > self.max_versions:
+                self._cache.popitem(last=False)
+        return result
+
+    def _series_forecast(self, result: Dict, dimension: str, key: str, metric: str) -> Optional[Dict]:
+        i = result['index'].get((dimension, key))
+        if i is None:
+            return None
+        data = result['metrics'][metric]
+        error = data['backtest_error'][i]
+        return {
+            'series': f"{dimension} {key}",
+            'metric': metric,
+            'periods': result['periods'],
+            'forecast': [round(float(v), 2) for v in data['forecast'][i]],
+            'model': str(data['model'][i]),
+            'last_value': round(float(data['last_value'][i]), 2),
+            'backtest_error': round(float(error), 2) if np.isfinite(error) else None,
+            'observations': int(data['observations'][i])
+        }
+
+    def forecast(self, df: pd.DataFrame, dimension: str, key: str, metric: str = 'wait_time',
+                 version: Optional[str] = None) -> Optional[Dict]:
+        return self._series_forecast(self.get_forecasts(df, version), dimension, key, metric)
+
+    def summarize(self, df: pd.DataFrame, intent: Dict, question: str = "", version: Optional[str] = None) -> str:
+        result = self.get_forecasts(df, version)
+        question_upper = question.upper()
+
+        series = [('Operator', op) for op in intent['entities']['operators']]
+        series += [key for key in result['keys'] if key[0] == 'BU' and key[1].upper() in question_upper]
+        if not series:
+            series = [('ALL', 'ALL')]
+            wait = result['metrics']['wait_time']['forecast'][:, 0]
+            bu_rows = [i for i, key in enumerate(result['keys']) if key[0] == 'BU' and not np.isnan(wait[i])]
+            series += [result['keys'][i] for i in sorted(bu_rows, key=lambda i: -wait[i])[:3]]
+
+        lines = [f"Forecast for {', '.join(result['periods'])} (monthly, fitted per dataset version):"]
+        for dimension, key in series:
+            wait = self._series_forecast(result, dimension, key, 'wait_time')
+            accuracy = self._series_forecast(result, dimension, key, 'arrival_accuracy')
+            if wait is None:
+                continue
+            label = "All operations" if dimension == 'ALL' else f"{dimension} {key}"
+            lines.append(
+                f"- {label}: wait time {wait['forecast']} h (last {wait['last_value']} h, model {wait['model']}, "
+                f"backtest error {wait['backtest_error']} h); arrival accuracy {accuracy['forecast']} % "
+                f"(last {accuracy['last_value']} %, model {accuracy['model']}); based on {wait['observations']} calls"
+            )
+        return "\n".join(lines)
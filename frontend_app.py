@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
+import uuid
 from powerbi_connector import PowerBIConnector
 from decision_engine import DecisionEngine
 from conversation_manager import ConversationManager
 from evaluation_system import EvaluationSystem
 from llm_client import LLMClient
+from query_pipeline import QueryPipeline, SAMPLE_QUESTIONS
+from single_flight import coalescing_metrics
+from session_store import SessionStore
 
 st.set_page_config(
     page_title="PRAXIS",
@@ -15,13 +19,23 @@ st.set_page_config(
 @st.cache_resource
 def initialize_components():
     pbi = PowerBIConnector()
-    engine = DecisionEngine()
-    conv_mgr = ConversationManager()
+    sessions = SessionStore()
     eval_sys = EvaluationSystem()
     llm = LLMClient()
-    return pbi, engine, conv_mgr, eval_sys, llm
+    pipeline = QueryPipeline(pbi, DecisionEngine(), ConversationManager(), eval_sys, llm)
+    return pbi, sessions, eval_sys, llm, pipeline
 
-pbi, engine, conv_mgr, eval_sys, llm = initialize_components()
+@st.cache_resource
+def engine_for(strategy: str) -> DecisionEngine:
+    # Cached resources are shared by every session, so each strategy gets its own
+    # engine instead of one session re-weighting another's answers.
+    return DecisionEngine(strategy)
+
+pbi, sessions, eval_sys, llm, pipeline = initialize_components()
+
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+conv_mgr = sessions.get(st.session_state.session_id)
 
 if 'messages' not in st.session_state:
     st.session_state.messages = []
@@ -39,13 +53,11 @@ with st.sidebar:
         ["balanced", "carbon_reduction", "cost_efficiency", "reliability"]
     )
     
-    from config import decision_weights
-    engine.weights = decision_weights.update_for_strategy(strategy)
-    
     st.divider()
     
     st.header("Performance Metrics")
-    metrics = eval_sys.get_real_time_metrics()
+    metrics = eval_sys.get_real_time_metrics(st.session_state.session_id)
+    global_metrics = eval_sys.get_real_time_metrics()
     
     col1, col2 = st.columns(2)
     with col1:
@@ -60,6 +72,13 @@ with st.sidebar:
         else:
             st.metric("Speedup", "N/A")
     
+    coalesced = sum(flight['coalesced'] for flight in coalescing_metrics().values())
+    st.caption(f"All users: {global_metrics['queries_per_min']} queries/min, "
+               f"{global_metrics['tokens_per_min']} tokens/min")
+    st.caption(f"Coalesced backend calls: {coalesced}")
+    if st.session_state.data_cache is not None:
+        st.caption(f"Dataset version: {st.session_state.data_cache.attrs.get('dataset_version')}")
+    
     st.divider()
     
     if st.button("Clear Conversation"):
@@ -87,84 +106,25 @@ if prompt := st.chat_input("Ask about operations, performance, or get recommenda
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         
-        start_time = eval_sys.start_query()
-        
         try:
-            intent = conv_mgr.infer_intent(prompt)
-            
             if st.session_state.data_cache is None:
-                with st.spinner("Fetching data from Power BI..."):
-                    st.session_state.data_cache = pbi.get_operator_data()
-            
-            df = st.session_state.data_cache
-            
-            if intent['entities']['operators']:
-                operators = intent['entities']['operators']
-                df_filtered = df[df['Operator'].isin(operators)]
-            else:
-                df_filtered = df
-            
-            if intent['type'] == 'comparison' and len(intent['entities']['operators']) >= 2:
-                comparison = engine.compare_operators(df, intent['entities']['operators'])
-                data_summary = f"Operator Comparison:\n{comparison}"
-            elif intent['type'] == 'ranking':
-                top_performers = engine.get_top_performers(df_filtered)
-                data_summary = f"Top Performers:\n{top_performers.to_string()}"
-            else:
-                analyzed = engine.analyze_dataframe(df_filtered.head(50))
-                stats = {
-                    'total_vessels': len(analyzed),
-                    'avg_dis': round(analyzed['DIS_Score'].mean(), 2),
-                    'avg_wait_time': round(analyzed['Wait Time (Hours): ATB-BTR'].mean(), 2),
-                    'total_bunker_saved': round(analyzed['Bunker Saved (USD)'].sum(), 2),
-                    'on_time_rate': round((analyzed['Arrival Accuracy (Final BTR)'] == 'Y').mean() * 100, 1)
-                }
-                data_summary = f"Analysis Summary:\n{stats}"
-            
-            full_prompt = conv_mgr.build_prompt(prompt, data_summary)
-            
-            response = llm.generate_response(
-                full_prompt,
-                system_message="You are a maritime operations analyst for PSA International. Provide clear, data-driven insights."
-            )
-            
-            if response['success']:
-                answer = response['content']
+                spinner_text = "Fetching data from Power BI..."
             else:
-                answer = "Unable to generate response. Please try again."
+                spinner_text = "Analyzing..."
             
-            recommendations = engine.generate_recommendations(df_filtered)
+            with st.spinner(spinner_text), sessions.checkout(st.session_state.session_id) as conv_mgr:
+                result = pipeline.handle_message(prompt, st.session_state.data_cache, conv_mgr,
+                                                 st.session_state.session_id, engine_for(strategy))
             
-            full_response = f"{answer}\n\n**Recommendations:**\n"
-            for i, rec in enumerate(recommendations[:3], 1):
-                full_response += f"{i}. {rec}\n"
-            
-            message_placeholder.markdown(full_response)
-            
-            response_time = eval_sys.end_query(start_time)
-            
-            quality = eval_sys.evaluate_answer_quality(
-                answer,
-                has_metrics='avg' in answer.lower() or 'total' in answer.lower(),
-                has_recommendations=len(recommendations) > 0
-            )
-            
-            performance_data = {
-                'response_time': round(response_time, 2),
-                'quality_score': quality['quality_score'],
-                'tokens_used': response.get('tokens_used', 0),
-                'speedup_vs_manual': eval_sys.calculate_speedup(response_time)
-            }
+            st.session_state.data_cache = result['data']
+            message_placeholder.markdown(result['content'])
             
             st.session_state.messages.append({
                 "role": "assistant",
-                "content": full_response,
-                "metrics": performance_data
+                "content": result['content'],
+                "metrics": result['metrics']
             })
             
-            conv_mgr.add_message("user", prompt)
-            conv_mgr.add_message("assistant", answer)
-            
             st.rerun()
             
         except Exception as e:
@@ -174,10 +134,4 @@ if prompt := st.chat_input("Ask about operations, performance, or get recommenda
             st.rerun()
 
 with st.expander("Sample Questions"):
-    st.markdown("""
-    - Compare GRN and NVX operator performance
-    - Show top 5 vessels by efficiency
-    - What are the main delay factors?
-    - Which operators have best carbon performance?
-    - Recommend improvements for wait time reduction
-    """)
\ No newline at end of file
+    st.markdown("\n".join(f"- {question}" for question in SAMPLE_QUESTIONS))
\ No newline at end of file
@@ -5,13 +5,20 @@ Where Thought Becomes Action
 
 from powerbi_connector import PowerBIConnector
 from decision_engine import DecisionEngine
-from llm_client import LLMClient
+from llm_client import LLMClient, SYSTEM_MESSAGE
 from evaluation_system import EvaluationSystem
+from memory_monitor import MemoryMonitor
+from berth_index import BerthIndex, INDEX_COLUMNS, add_berth_congestion
+from config import memory_config, planner_config
 import pandas as pd
+import json
 import logging
 from datetime import datetime
 from pathlib import Path
 
+OUTPUT_PATH = Path('data/output.csv')
+VERSION_PATH = Path('data/output_version.json')
+
 Path('data').mkdir(exist_ok=True)
 Path('logs').mkdir(exist_ok=True)
 
@@ -28,6 +35,27 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+MUST_HAVE_COLUMNS = [
+    'DIS_Score', 'Time_Efficiency', 'Cost_Efficiency',
+    'Environmental_Score', 'Risk_Score'
+]
+
+OPTIONAL_COLUMNS = [
+    'Operator', 'Vessel', 'Service', 'BU',
+    'Wait Time (Hours): ATB-BTR',
+    'Arrival Accuracy (Final BTR)',
+    'Bunker Saved (USD)',
+    'Carbon Abatement (Tonnes)',
+    'Berth_Congestion'
+]
+
+NARRATIVE_GROUPS = {'operators': 'Operator', 'business_units': 'BU'}
+
+NARRATIVE_INSTRUCTION = (
+    "Write a two-sentence performance narrative for each {group} below from its stats: "
+    "name its strongest and weakest metric and one concrete action."
+)
+
 class JobPlanner:
     def __init__(self):
         logger.info("="*60)
@@ -39,23 +67,50 @@ class JobPlanner:
         self.engine = DecisionEngine()
         self.llm = LLMClient()
         self.eval_sys = EvaluationSystem()
+        self.memory = MemoryMonitor()
     
     def plan_operations(self):
         logger.info("Starting job planning process")
         
         start_time = self.eval_sys.start_query()
         logger.info("Fetching vessel data from Power BI")
-        df = self.pbi.get_operator_data()
+        with self.memory.stage('fetch'):
+            dataset_version, fingerprint = self.pbi.fingerprint_if_changed(self.exported_version())
+            reused = fingerprint is None
+            rows = 0 if reused else int(fingerprint['Rows'] or 0)
+            paged = not reused and self.memory.rows_over_budget(rows)
+            if not reused and not paged:
+                dataset_version, df = self.pbi.fetch_version(dataset_version)
         fetch_time = self.eval_sys.end_query(start_time)
         
-        logger.info(f"Retrieved {len(df)} vessel records in {fetch_time:.2f}s")
+        if reused:
+            logger.info(f"Dataset unchanged (version {dataset_version}), reusing scores in {OUTPUT_PATH}")
+        elif paged:
+            logger.warning(f"Projected memory {self.memory.projected_rows_mb(rows):.0f}MB for {rows} rows exceeds "
+                           f"budget {memory_config.budget_mb:.0f}MB, fetching and analyzing pages of "
+                           f"{memory_config.chunk_rows} rows")
+        else:
+            logger.info(f"Retrieved {len(df)} vessel records (version {dataset_version}) "
+                        f"in {fetch_time:.2f}s{self.memory.describe('fetch')}")
+            add_berth_congestion(df)
         
         logger.info("Running decision engine analysis")
         start_time = self.eval_sys.start_query()
-        analyzed_df = self.engine.analyze_dataframe(df)
+        with self.memory.stage('analysis'):
+            if reused:
+                analyzed_df = pd.read_csv(OUTPUT_PATH)
+            elif paged:
+                analyzed_df = self.analyze_paged(dataset_version, rows)
+                if not self.pbi.confirm_version(dataset_version)[0]:
+                    # Pages may straddle a refresh; leave the export unversioned so the next run re-scores.
+                    logger.warning(f"Dataset changed while paging (version {dataset_version}), "
+                                   f"scores will be recomputed on the next run")
+                    dataset_version = None
+            else:
+                analyzed_df = self.engine.analyze_dataframe(df)
         analysis_time = self.eval_sys.end_query(start_time)
         
-        logger.info(f"Analysis completed in {analysis_time:.2f}s")
+        logger.info(f"Analysis completed in {analysis_time:.2f}s{self.memory.describe('analysis')}")
         logger.info(f"Average DIS Score: {analyzed_df['DIS_Score'].mean():.2f}")
         logger.info(f"Average Time Efficiency: {analyzed_df['Time_Efficiency'].mean():.2f}")
         logger.info(f"Average Cost Efficiency: {analyzed_df['Cost_Efficiency'].mean():.2f}")
@@ -66,58 +121,121 @@ class JobPlanner:
         
         logger.info("Generating AI recommendations")
         start_time = self.eval_sys.start_query()
-        recommendations = self.engine.generate_recommendations(df)
+        with self.memory.stage('recommendations'):
+            recommendations = self.engine.recommendations_from_analyzed(analyzed_df)
         rec_time = self.eval_sys.end_query(start_time)
         
-        logger.info(f"Recommendations generated in {rec_time:.2f}s")
+        logger.info(f"Recommendations generated in {rec_time:.2f}s{self.memory.describe('recommendations')}")
         for i, rec in enumerate(recommendations, 1):
             logger.info(f"  Recommendation {i}: {rec}")
         
+        narratives, narrative_time = {}, 0.0
+        cached_narratives = self.exported_narratives() if reused else None
+        if planner_config.narratives and cached_narratives:
+            narratives = cached_narratives
+            logger.info(f"Dataset unchanged, reusing narratives in {VERSION_PATH}")
+        elif planner_config.narratives:
+            logger.info("Generating operator and BU narratives")
+            start_time = self.eval_sys.start_query()
+            with self.memory.stage('narratives'):
+                narratives = self.generate_narratives(analyzed_df)
+            narrative_time = self.eval_sys.end_query(start_time)
+            
+            logger.info(f"Narratives generated in {narrative_time:.2f}s{self.memory.describe('narratives')}")
+            for group, entries in narratives.items():
+                for entity, narrative in entries.items():
+                    logger.info(f"  {entity}: {narrative}")
+        
         return {
             'analyzed_data': analyzed_df,
             'priorities': priorities,
             'recommendations': recommendations,
+            'narratives': narratives,
+            'dataset_version': dataset_version,
+            'reused': reused,
             'metrics': {
                 'fetch_time': fetch_time,
                 'analysis_time': analysis_time,
                 'rec_time': rec_time,
-                'total_time': fetch_time + analysis_time + rec_time
-            }
+                'narrative_time': narrative_time,
+                'total_time': fetch_time + analysis_time + rec_time + narrative_time
+            },
+            'memory': dict(self.memory.stages)
         }
     
+    def analyze_paged(self, dataset_version: str, rows: int) -> pd.DataFrame:
+        # Congestion needs every call at a berth, so the index is built from a
+        # narrow fetch of its columns and applied to each page as it arrives.
+        index = BerthIndex(self.pbi.get_columns(INDEX_COLUMNS), dataset_version)
+        
+        def pages():
+            for page in self.pbi.iter_data_pages(rows, memory_config.chunk_rows, dataset_version):
+                add_berth_congestion(page, index)
+                yield page
+        
+        return self.engine.analyze_pages(pages(), OPTIONAL_COLUMNS + MUST_HAVE_COLUMNS)
+    
+    def generate_narratives(self, analyzed_df: pd.DataFrame) -> dict:
+        # One batched JSON request per group instead of a round trip per entity.
+        narratives = {}
+        for group, column in NARRATIVE_GROUPS.items():
+            if column not in analyzed_df.columns:
+                continue
+            entities = self.engine.entity_stats(analyzed_df, column)
+            batch = self.llm.generate_batch(entities, NARRATIVE_INSTRUCTION.format(group=column),
+                                            system_message=SYSTEM_MESSAGE)
+            logger.info(f"{len(batch['narratives'])}/{len(entities)} {column} narratives in "
+                        f"{batch['requests']} requests ({batch['tokens_used']} tokens)")
+            if batch['failed']:
+                logger.warning(f"No valid narrative for {column}: {', '.join(batch['failed'])}")
+            narratives[group] = batch['narratives']
+        return narratives
+    
+    def exported(self) -> dict:
+        # Metadata of the last export, if it was scored with the same strategy.
+        if not OUTPUT_PATH.exists() or not VERSION_PATH.exists():
+            return {}
+        exported = json.loads(VERSION_PATH.read_text())
+        return exported if exported.get('strategy') == self.engine.strategy else {}
+    
+    def exported_version(self):
+        return self.exported().get('dataset_version')
+    
+    def exported_narratives(self) -> dict:
+        return self.exported().get('narratives') or {}
+    
+    def write_version(self, results):
+        VERSION_PATH.write_text(json.dumps({'dataset_version': results['dataset_version'],
+                                            'strategy': self.engine.strategy,
+                                            'narratives': results['narratives']}))
+    
     def export_results(self, results):
+        if results['reused']:
+            logger.info(f"Dataset unchanged, keeping existing {OUTPUT_PATH}")
+            # Narratives may be new to this run even when the scores are not.
+            self.write_version(results)
+            return
+        
         logger.info("Exporting results to data/output.csv")
         
         analyzed_df = results['analyzed_data']
         
         logger.info(f"Available columns: {list(analyzed_df.columns)}")
         
-        must_have_cols = [
-            'DIS_Score', 'Time_Efficiency', 'Cost_Efficiency',
-            'Environmental_Score', 'Risk_Score'
-        ]
-        
-        optional_cols = [
-            'Operator', 'Vessel', 'Service', 'BU',
-            'Wait Time (Hours): ATB-BTR',
-            'Arrival Accuracy (Final BTR)',
-            'Bunker Saved (USD)',
-            'Carbon Abatement (Tonnes)'
-        ]
-        
         export_cols = []
         
-        for col in optional_cols:
+        for col in OPTIONAL_COLUMNS:
             if col in analyzed_df.columns:
                 export_cols.append(col)
         
-        export_cols.extend(must_have_cols)
+        export_cols.extend(MUST_HAVE_COLUMNS)
         
-        output_df = analyzed_df[export_cols].copy()
-        output_df = output_df.sort_values('DIS_Score', ascending=False)
-        output_df.to_csv('data/output.csv', index=False)
+        with self.memory.stage('export'):
+            output_df = analyzed_df[export_cols].sort_values('DIS_Score', ascending=False)
+            output_df.to_csv(OUTPUT_PATH, index=False, chunksize=memory_config.chunk_rows)
+        self.write_version(results)
         
-        logger.info(f"Exported {len(output_df)} records to data/output.csv")
+        logger.info(f"Exported {len(output_df)} records to data/output.csv{self.memory.describe('export')}")
         logger.info(f"Columns included: {len(export_cols)} columns")
     
     def show_performance_comparison(self, metrics):
@@ -132,6 +250,7 @@ class JobPlanner:
         logger.info(f"  - Data Fetch: {metrics['fetch_time']:.2f}s")
         logger.info(f"  - Analysis: {metrics['analysis_time']:.2f}s")
         logger.info(f"  - Recommendations: {metrics['rec_time']:.2f}s")
+        logger.info(f"  - Narratives: {metrics['narrative_time']:.2f}s")
         logger.info("")
         logger.info(f"Manual Processing Time (estimated): {manual_time:.0f} seconds")
         logger.info(f"  - Manual dashboard navigation: ~60s")
@@ -159,9 +278,10 @@ if __name__ == "__main__":
     try:
         planner = JobPlanner()
         
-        results = planner.plan_operations()
-        
-        planner.export_results(results)
+        with planner.memory:
+            results = planner.plan_operations()
+            
+            planner.export_results(results)
         
         planner.show_performance_comparison(results['metrics'])
         
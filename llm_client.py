@@ -1,13 +1,38 @@
+import json
+import threading
+import time
 import requests
-from typing import Dict, Optional
-from config import gpt_config
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from config import AzureGPTConfig, gpt_config
+from single_flight import get_flight, flight_key
+
+SYSTEM_MESSAGE = "You are a maritime operations analyst for PSA International. Provide clear, data-driven insights."
+
+_executors: Dict[int, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+def get_executor(workers: int) -> ThreadPoolExecutor:
+    # Clients of the same size share one pool, so building an LLMClient per
+    # session or test does not leave another set of idle threads behind.
+    with _executors_lock:
+        if workers not in _executors:
+            _executors[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="praxis-llm")
+        return _executors[workers]
 
 class LLMClient:
-    def __init__(self):
-        self.config = gpt_config
+    def __init__(self, config: Optional[AzureGPTConfig] = None):
+        self.config = config or gpt_config
         self.api_url = f"{self.config.endpoint}openai/deployments/{self.config.deployment_name}/chat/completions"
+        self._executor = get_executor(self.config.max_concurrent_calls * self.config.max_attempts)
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'requests': 0, 'attempts': 0, 'hedged': 0, 'hedge_wins': 0, 'retries': 0,
+                      'abandoned': 0, 'deadline_exceeded': 0, 'failures': 0, 'fallbacks': 0, 'retry_after_waits': 0,
+                      'batch_requests': 0, 'batch_entities': 0, 'batch_retried_entities': 0, 'batch_splits': 0}
         
-    def generate_response(self, prompt: str, system_message: Optional[str] = None) -> Dict:
+    def _build_request(self, prompt: str, system_message: Optional[str] = None) -> Tuple[Dict, Dict, Dict]:
         headers = {
             "Content-Type": "application/json",
             "api-key": self.config.api_key
@@ -30,27 +55,265 @@ class LLMClient:
         }
         
         params = {"api-version": self.config.api_version}
+        return headers, payload, params
+    
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+    
+    def hedge_delay(self) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.config.hedge_min_samples:
+            return self.config.hedge_delay_seconds
+        index = min(len(latencies) - 1, int(round(self.config.hedge_percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+    
+    def generate_response(self, prompt: str, system_message: Optional[str] = None,
+                          fallback: Optional[Callable[[], str]] = None) -> Dict:
+        self._count('calls')
+        headers, payload, params = self._build_request(prompt, system_message)
+        settings = {k: v for k, v in payload.items() if k != "messages"}
+        key = flight_key(self.api_url, json.dumps(settings, sort_keys=True),
+                         *[f"{m['role']}: {m['content']}" for m in payload["messages"]])
+        try:
+            result, shared = get_flight("llm").do(key, lambda: self._hedged_completion(headers, payload, params))
+        except Exception:
+            if fallback is None:
+                raise
+            return self.fallback_response(fallback)
+        if not result['success'] and fallback is not None:
+            return self.fallback_response(fallback)
+        return dict(result) if shared else result
+    
+    def fallback_response(self, fallback: Callable[[], str]) -> Dict:
+        # Not a model answer: success stays False so callers and metrics see the miss.
+        self._count('fallbacks')
+        return {'content': fallback(), 'tokens_used': 0, 'success': False, 'fallback': True}
+    
+    def _launch(self, headers: Dict, payload: Dict, params: Dict, timeout: float, hedge: bool):
+        started = time.perf_counter()
+        future = self._executor.submit(self._post_completion, headers, payload, params, timeout)
+        future.hedge, future.started = hedge, started
+        self._count('attempts')
+        return future
+    
+    def _hedged_completion(self, headers: Dict, payload: Dict, params: Dict) -> Dict:
+        # Start one request and add a duplicate only while it is still running once the
+        # usual (percentile) latency has passed; a failed attempt is retried after a
+        # backoff, or after a 429's Retry-After, instead. Attempts stop
+        # fallback_margin_seconds before the deadline.
+        self._count('requests')
+        start = time.perf_counter()
+        deadline = start + max(0.0, self.config.deadline_seconds - self.config.fallback_margin_seconds)
+        hedge_at = retry_at = start
+        attempts, failures, pending, last_failure, last_error = 0, 0, set(), None, None
         
+        try:
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if attempts < self.config.max_attempts:
+                    if not pending and now >= retry_at:
+                        if attempts:
+                            self._count('retries')
+                        pending.add(self._launch(headers, payload, params,
+                                                 min(self.config.request_timeout_seconds, deadline - now), False))
+                        attempts += 1
+                        hedge_at = now + self.hedge_delay()
+                    elif pending and now >= hedge_at:
+                        self._count('hedged')
+                        pending.add(self._launch(headers, payload, params,
+                                                 min(self.config.request_timeout_seconds, deadline - now), True))
+                        attempts += 1
+                if not pending and attempts >= self.config.max_attempts:
+                    break
+                
+                wake_at = deadline
+                if attempts < self.config.max_attempts:
+                    wake_at = min(wake_at, hedge_at if pending else retry_at)
+                timeout = max(0.0, wake_at - time.perf_counter())
+                if not pending:
+                    time.sleep(timeout)
+                    continue
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error, result = e, None
+                    if result is not None and result['success']:
+                        # The hedge delay is a percentile of single attempts, not of hedged calls.
+                        with self._lock:
+                            self._latencies.append(time.perf_counter() - future.started)
+                        if future.hedge:
+                            self._count('hedge_wins')
+                        return result
+                    last_failure = result or last_failure
+                    failures += 1
+                    backoff = self.config.retry_backoff_seconds * 2 ** (failures - 1)
+                    if result is not None and result.get('retry_after'):
+                        self._count('retry_after_waits')
+                        backoff = max(backoff, result['retry_after'])
+                        hedge_at = max(hedge_at, time.perf_counter() + backoff)
+                    retry_at = time.perf_counter() + backoff
+                if not pending and retry_at >= deadline:
+                    # The next attempt could not start in time; fall back now rather than at the deadline.
+                    break
+        finally:
+            # Queued attempts are dropped; running ones end by their own timeout.
+            for future in pending:
+                if not future.cancel():
+                    self._count('abandoned')
+        
+        if time.perf_counter() >= deadline:
+            self._count('deadline_exceeded')
+            last_failure = {'content': f"Error: no response within {self.config.deadline_seconds}s deadline",
+                            'success': False, 'deadline_exceeded': True}
+        self._count('failures')
+        if last_failure is None:
+            raise last_error
+        return last_failure
+    
+    def generate_batch(self, entities: Dict[str, Dict], instruction: str,
+                       system_message: Optional[str] = None) -> Dict:
+        # One request carries many entities' stats and asks for a JSON object keyed
+        # by entity id; entities missing or malformed in the reply are re-requested.
+        # A batch whose request fails or misses its deadline is split in half and
+        # each half re-requested, since a long completion is the usual cause.
+        narratives, tokens_used, requests_made = {}, 0, 0
+        pending = list(entities)
+        self._count('batch_entities', len(pending))
+        
+        for attempt in range(self.config.batch_retries + 1):
+            if not pending:
+                break
+            if attempt:
+                self._count('batch_retried_entities', len(pending))
+            failed = []
+            batches = deque(pending[start:start + self.config.batch_size]
+                            for start in range(0, len(pending), self.config.batch_size))
+            while batches:
+                batch = batches.popleft()
+                result = self._complete_json(self._batch_prompt(instruction, {key: entities[key] for key in batch}),
+                                             system_message, len(batch))
+                requests_made += 1
+                tokens_used += result.get('tokens_used', 0)
+                if not result['success'] and len(batch) > 1:
+                    self._count('batch_splits')
+                    half = len(batch) // 2
+                    batches.extendleft([batch[half:], batch[:half]])
+                    continue
+                parsed = self._parse_batch(result)
+                for key in batch:
+                    if isinstance(parsed.get(key), str) and parsed[key].strip():
+                        narratives[key] = parsed[key].strip()
+                    else:
+                        failed.append(key)
+            pending = failed
+        
+        return {
+            'narratives': narratives,
+            'failed': pending,
+            'requests': requests_made,
+            'tokens_used': tokens_used,
+            'success': not pending
+        }
+    
+    def _batch_prompt(self, instruction: str, batch: Dict[str, Dict]) -> str:
+        return (f"{instruction}\n\n"
+                "Respond with a JSON object only: one key per entity id below, each value a plain-text "
+                "narrative string.\n\n"
+                f"Entities: {json.dumps(batch, separators=(',', ':'), default=str)}")
+    
+    def _parse_batch(self, result: Dict) -> Dict:
+        if not result['success']:
+            return {}
+        try:
+            parsed = json.loads(result['content'])
+        except ValueError:
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
+    
+    def _complete_json(self, prompt: str, system_message: Optional[str], entity_count: int) -> Dict:
+        self._count('batch_requests')
+        headers, payload, params = self._build_request(prompt, system_message)
+        payload["response_format"] = {"type": "json_object"}
+        payload["max_tokens"] = max(self.config.max_tokens, self.config.batch_entity_tokens * entity_count)
+        try:
+            return self._hedged_completion(headers, payload, params)
+        except Exception as e:
+            return {'content': f"Error: {e}", 'success': False}
+    
+    def _post_completion(self, headers: Dict, payload: Dict, params: Dict, timeout: float = 30) -> Dict:
         response = requests.post(
             self.api_url,
             headers=headers,
             json=payload,
             params=params,
-            timeout=30
+            timeout=timeout
         )
         
         if response.status_code == 200:
-            result = response.json()
-            return {
-                'content': result['choices'][0]['message']['content'],
-                'tokens_used': result['usage']['total_tokens'],
-                'success': True
-            }
-        else:
-            return {
-                'content': f"Error: {response.text}",
-                'success': False
-            }
+            try:
+                result = response.json()
+                return {
+                    'content': result['choices'][0]['message']['content'],
+                    'tokens_used': result['usage']['total_tokens'],
+                    'success': True
+                }
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                return {'content': f"Error: malformed response ({e!r}): {response.text[:200]}", 'success': False}
+        failure = {'content': f"Error: {response.text}", 'success': False}
+        if response.status_code == 429:
+            try:
+                failure['retry_after'] = float(response.headers.get('Retry-After', 0))
+            except ValueError:
+                pass
+        return failure
+    
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        requests_made = max(1, stats['requests'])
+        stats['hedge_rate'] = round(stats['hedged'] / requests_made, 3)
+        stats['deadline_rate'] = round(stats['deadline_exceeded'] / requests_made, 3)
+        stats['fallback_rate'] = round(stats['fallbacks'] / max(1, stats['calls']), 3)
+        stats['entities_per_batch'] = round(stats['batch_entities'] / max(1, stats['batch_requests']), 2)
+        stats['hedge_delay_seconds'] = round(self.hedge_delay(), 3)
+        return stats
+    
+    def stream_response(self, prompt: str, system_message: Optional[str] = None) -> Iterator[str]:
+        # The first chunk has to arrive with fallback_margin_seconds to spare and the
+        # whole stream within deadline_seconds, matching generate_response.
+        self._count('calls')
+        headers, payload, params = self._build_request(prompt, system_message)
+        payload["stream"] = True
+        start = time.perf_counter()
+        deadline = start + self.config.deadline_seconds
+        first_chunk_by = start + max(0.0, self.config.deadline_seconds - self.config.fallback_margin_seconds)
+        streamed = False
+        
+        with requests.post(self.api_url, headers=headers, json=payload, params=params, stream=True,
+                           timeout=min(self.config.request_timeout_seconds, max(0.001, first_chunk_by - start))) as response:
+            if response.status_code != 200:
+                raise Exception(f"Streaming failed: {response.text}")
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if time.perf_counter() >= (deadline if streamed else first_chunk_by):
+                    self._count('deadline_exceeded')
+                    raise requests.Timeout(f"Stream not complete within {self.config.deadline_seconds}s deadline")
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get('choices') or [{}]
+                content = choices[0].get('delta', {}).get('content')
+                if content:
+                    streamed = True
+                    yield content
     
     def summarize_data(self, data_dict: Dict) -> str:
         summary_prompt = f"""Analyze this operational data and provide key insights:
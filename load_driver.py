@@ -0,0 +1,260 @@
+"""
+PRAXIS - Load Driver
+Replays a corpus of chat questions from N simulated users at a target rate
+against the query pipeline and reports throughput, per-stage tail latency
+and memory growth.
+
+    python load_driver.py --users 30 --rate 5 --messages 300 --latency-ms 400 --jitter-ms 150
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import PowerBIConfig, AzureGPTConfig, StandInConfig
+from powerbi_connector import PowerBIConnector
+from decision_engine import DecisionEngine
+from conversation_manager import ConversationManager
+from evaluation_system import EvaluationSystem
+from llm_client import LLMClient
+from local_standin import StandInServer
+from query_pipeline import QueryPipeline, SAMPLE_QUESTIONS, STAGES
+from single_flight import coalescing_metrics
+from session_store import SessionStore
+from memory_monitor import rss_mb
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    if not path:
+        return list(SAMPLE_QUESTIONS)
+    lines = Path(path).read_text().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+
+class LoadDriver:
+    def __init__(self, pipeline: QueryPipeline, corpus: List[str], users: int, rate: float,
+                 total_messages: int, seed: int = 404):
+        self.pipeline = pipeline
+        self.corpus = corpus
+        self.users = users
+        self.rate = rate
+        self.total_messages = total_messages
+        self.rng = random.Random(seed)
+        self.sessions = SessionStore()
+        self.results: List[Dict] = []
+        self.memory_samples: List[Dict] = []
+        self._next_ticket = 0
+        self._lock = threading.Lock()
+
+    def _take_ticket(self) -> Optional[int]:
+        with self._lock:
+            if self._next_ticket >= self.total_messages:
+                return None
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            return ticket
+
+    def _sample_memory(self, started: float):
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            self.memory_samples.append({
+                'elapsed': time.perf_counter() - started,
+                'completed': len(self.results),
+                'rss_mb': rss_mb(),
+                'traced_mb': current / (1024 * 1024),
+                'traced_peak_mb': peak / (1024 * 1024)
+            })
+
+    def _simulated_user(self, user_id: int, started: float):
+        rng = random.Random(self.rng.random() + user_id)
+        session = {'data_cache': None}
+
+        while True:
+            ticket = self._take_ticket()
+            if ticket is None:
+                return
+
+            scheduled = started + ticket / self.rate if self.rate > 0 else time.perf_counter()
+            lag = scheduled - time.perf_counter()
+            if lag > 0:
+                time.sleep(lag)
+
+            question = rng.choice(self.corpus)
+            send_time = time.perf_counter()
+            record = {
+                'user': user_id,
+                'question': question,
+                'schedule_delay': max(0.0, send_time - scheduled)
+            }
+
+            try:
+                session_id = f"load-user-{user_id}"
+                with self.sessions.checkout(session_id) as conv_mgr:
+                    result = self.pipeline.handle_message(question, session['data_cache'], conv_mgr, session_id)
+                session['data_cache'] = result['data']
+                record['stage_times'] = result['stage_times']
+                record['llm_success'] = result['llm_success']
+                record['error'] = None
+            except Exception as e:
+                record['stage_times'] = {}
+                record['llm_success'] = False
+                record['error'] = str(e)
+
+            record['latency'] = time.perf_counter() - send_time
+
+            with self._lock:
+                self.results.append(record)
+                completed = len(self.results)
+
+            if completed % max(1, self.total_messages // 20) == 0:
+                self._sample_memory(started)
+
+    def run(self) -> Dict:
+        tracemalloc.start()
+        started = time.perf_counter()
+        self._sample_memory(started)
+
+        threads = [
+            threading.Thread(target=self._simulated_user, args=(user_id, started), daemon=True)
+            for user_id in range(self.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+        self._sample_memory(started)
+        tracemalloc.stop()
+
+        return self.build_report(elapsed)
+
+    def build_report(self, elapsed: float) -> Dict:
+        completed = [r for r in self.results if r['error'] is None]
+        latencies = [r['latency'] for r in completed]
+
+        stages = {}
+        for stage in STAGES:
+            values = [r['stage_times'][stage] for r in completed if stage in r['stage_times']]
+            stages[stage] = {
+                'p50_ms': round(percentile(values, 50) * 1000, 1),
+                'p95_ms': round(percentile(values, 95) * 1000, 1),
+                'p99_ms': round(percentile(values, 99) * 1000, 1),
+                'max_ms': round(max(values, default=0) * 1000, 1)
+            }
+
+        first, last = self.memory_samples[0], self.memory_samples[-1]
+
+        return {
+            'users': self.users,
+            'target_rate_per_s': self.rate,
+            'messages': len(self.results),
+            'errors': len(self.results) - len(completed),
+            # Includes calls answered by the templated fallback.
+            'llm_failures': sum(1 for r in completed if not r['llm_success']),
+            'elapsed_s': round(elapsed, 2),
+            'throughput_per_s': round(len(completed) / elapsed, 2) if elapsed > 0 else 0,
+            'schedule_delay_p95_ms': round(percentile([r['schedule_delay'] for r in self.results], 95) * 1000, 1),
+            'end_to_end': {
+                'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+                'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+                'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+                'max_ms': round(max(latencies, default=0) * 1000, 1)
+            },
+            'stages': stages,
+            'memory': {
+                'rss_start_mb': round(first['rss_mb'], 1),
+                'rss_end_mb': round(last['rss_mb'], 1),
+                'rss_growth_mb': round(last['rss_mb'] - first['rss_mb'], 1),
+                'traced_growth_mb': round(last['traced_mb'] - first['traced_mb'], 1),
+                'traced_peak_mb': round(max(s['traced_peak_mb'] for s in self.memory_samples), 1)
+            },
+            'coalescing': coalescing_metrics(),
+            'sessions': self.sessions.get_stats(),
+            'llm': self.pipeline.llm.get_stats(),
+            'errors_sample': [r['error'] for r in self.results if r['error']][:5]
+        }
+
+def print_report(report: Dict):
+    print("=" * 60)
+    print("PRAXIS Load Test")
+    print("=" * 60)
+    print(f"Users: {report['users']}  Target rate: {report['target_rate_per_s']}/s  "
+          f"Messages: {report['messages']}  Errors: {report['errors']}  LLM failures: {report['llm_failures']}")
+    print(f"Elapsed: {report['elapsed_s']}s  Throughput: {report['throughput_per_s']}/s  "
+          f"Schedule delay p95: {report['schedule_delay_p95_ms']}ms")
+    print("")
+    print(f"{'Stage':<18}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in list(report['stages'].items()) + [('end_to_end', report['end_to_end'])]:
+        print(f"{stage:<18}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print("")
+    memory = report['memory']
+    print(f"RSS: {memory['rss_start_mb']}MB -> {memory['rss_end_mb']}MB (+{memory['rss_growth_mb']}MB)  "
+          f"Traced growth: {memory['traced_growth_mb']}MB  Traced peak: {memory['traced_peak_mb']}MB")
+    for name, flight in report['coalescing'].items():
+        print(f"Coalescing [{name}]: {flight['calls']} calls, {flight['executions']} executed, "
+              f"{flight['coalesced']} coalesced ({flight['coalesced_ratio'] * 100:.1f}%)")
+    llm = report['llm']
+    print(f"LLM: {llm['requests']} requests, hedged {llm['hedge_rate'] * 100:.1f}% "
+          f"({llm['hedge_wins']} hedge wins, delay {llm['hedge_delay_seconds']}s), {llm['retries']} retries, "
+          f"{llm['abandoned']} abandoned, deadline misses {llm['deadline_exceeded']}, "
+          f"fallback {llm['fallback_rate'] * 100:.1f}%")
+    for error in report['errors_sample']:
+        print(f"  error: {error}")
+    print("=" * 60)
+
+def main():
+    parser = argparse.ArgumentParser(description="PRAXIS concurrent-user load driver")
+    parser.add_argument("--users", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=5.0, help="Target messages per second across all users")
+    parser.add_argument("--messages", type=int, default=300, help="Total messages to send")
+    parser.add_argument("--corpus", help="File with one question per line (defaults to the sample questions)")
+    parser.add_argument("--standin-url", help="Use a running stand-in instead of starting one in-process")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=404)
+    parser.add_argument("--json", help="Write the report to this path")
+    args = parser.parse_args()
+
+    server = None
+    if args.standin_url:
+        settings = StandInConfig(url=args.standin_url)
+    else:
+        settings = StandInConfig(url="", latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                 rate_limit_ratio=args.rate_limit, result_rows=args.rows, seed=args.seed)
+        server = StandInServer(settings)
+        settings.url = server.start()
+
+    pbi_config, gpt_config = PowerBIConfig(), AzureGPTConfig(max_concurrent_calls=args.users)
+    settings.apply(pbi_config, gpt_config)
+
+    pipeline = QueryPipeline(
+        PowerBIConnector(pbi_config), DecisionEngine(), ConversationManager(),
+        EvaluationSystem(), LLMClient(gpt_config)
+    )
+    driver = LoadDriver(pipeline, load_corpus(args.corpus), args.users, args.rate, args.messages, args.seed)
+
+    try:
+        report = driver.run()
+    finally:
+        if server:
+            server.stop()
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
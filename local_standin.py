@@ -0,0 +1,501 @@
+"""
+PRAXIS - Local Stand-in
+Record/replay imitation of the MSAL token endpoint, the Power BI REST API
+and the Azure OpenAI chat completions endpoint.
+
+    python local_standin.py --mode replay --port 8765 --latency-ms 150 --jitter-ms 50
+    PRAXIS_STANDIN_URL=http://127.0.0.1:8765 python job_planner.py
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+from config import PowerBIConfig, AzureGPTConfig, StandInConfig, standin_config
+from powerbi_connector import FINGERPRINT_QUERY
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = ['GRN', 'NVX', 'DPT', 'EVO', 'SVQ', 'AZQ', 'UVX', 'BLX', 'OPR', 'CRY']
+BUSINESS_UNITS = ['ANTWERP', 'BUSAN', 'LAEM CHABANG', 'SINGAPORE', 'JAKARTA',
+                  'MUMBAI', 'DAMMAM', 'PANAMA CITY', 'TIANJIN']
+VESSEL_PREFIXES = ['SILVER', 'PACIFIC', 'ATLANTIC', 'RAPID', 'GRAND', 'EASTERN',
+                   'WESTERN', 'OCEAN', 'NORTHERN', 'GOLDEN']
+VESSEL_SUFFIXES = ['HERON', 'FALCON', 'CORAL', 'CONSTELLATION', 'MARINER',
+                   'DOLPHIN', 'HARBOR', 'STAR', 'WAVE', 'PIONEER']
+PORT_CODES = ['SGSIN', 'BEANR', 'KRPUS', 'THLCH', 'IDJKT', 'INBOM', 'SADMM', 'PAPTY', 'CNTXG']
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+TOKEN_PATH = re.compile(r"^/[^/]+/oauth2/v2\.0/token$")
+REPORT_PATH = re.compile(r"^/v1\.0/myorg/groups/[^/]+/reports/[^/]+$")
+QUERY_PATH = re.compile(r"^/v1\.0/myorg/groups/[^/]+/datasets/[^/]+/executeQueries$")
+CHAT_PATH = re.compile(r"^/openai/deployments/[^/]+/chat/completions$")
+FULL_TABLE_QUERY = "EVALUATE 'Data'"
+OPERATOR_FILTER = re.compile(r"'Data'\[Operator\]\s*=\s*\"([^\"]+)\"")
+PAGE_FILTER = re.compile(r"TOPNSKIP\((\d+), (\d+), 'Data'")
+SELECTED_COLUMNS = re.compile(r"\"([^\"]+)\", 'Data'\[")
+
+_synthetic_cache: Dict[Tuple[int, int], List[Dict]] = {}
+_synthetic_lock = threading.Lock()
+
+def synthesize_rows(n: int, seed: int = 404) -> List[Dict]:
+    with _synthetic_lock:
+        if (n, seed) in _synthetic_cache:
+            return _synthetic_cache[(n, seed)]
+
+    rng = random.Random(seed)
+    vessels = [f"MV {p} {s}" for p in VESSEL_PREFIXES for s in VESSEL_SUFFIXES]
+    imo_numbers = {vessel: str(9100000 + i * 137) for i, vessel in enumerate(vessels)}
+    services = [f"{rng.randint(1, 9)}{rng.choice('ABCDEFGHKLOPQRV')}{rng.choice('0123456789MQ')}" for _ in range(30)]
+    origin = datetime(2024, 1, 1)
+
+    rows = []
+    for i in range(n):
+        vessel = rng.choice(vessels)
+        bu = rng.choice(BUSINESS_UNITS)
+        btr_96h = origin + timedelta(hours=rng.uniform(0, 24 * 640))
+        final_btr = btr_96h + timedelta(hours=rng.uniform(-6, 6))
+        wait = round(rng.uniform(-12, 12), 2)
+        atb = final_btr + timedelta(hours=wait)
+        atb_abt = round(rng.uniform(0, 3), 2)
+        abt = atb - timedelta(hours=atb_abt)
+        berth_time = round(rng.uniform(8, 60), 2)
+        atu = atb + timedelta(hours=berth_time)
+        on_time = abs(wait) <= 4
+
+        row = {
+            'Operator': rng.choice(OPERATORS),
+            'Service': rng.choice(services),
+            'Dir': rng.choice(['E', 'W', 'N', 'S']),
+            'BU': bu,
+            'Vessel': vessel,
+            'IMO': imo_numbers[vessel],
+            'Rotation No.': f"{bu[:3]}{atb.strftime('%y')}{i:06d}",
+            'From': rng.choice(PORT_CODES),
+            'To': rng.choice(PORT_CODES),
+            'Berth Status': 'Departed' if i < n * 0.97 else 'Alongside',
+            'BTR as at 96h to ATB': btr_96h.strftime(TIMESTAMP_FORMAT),
+            'Final BTR (Local Time)': final_btr.strftime(TIMESTAMP_FORMAT),
+            'ABT (Local Time)': abt.strftime(TIMESTAMP_FORMAT),
+            'ATB (Local Time)': atb.strftime(TIMESTAMP_FORMAT),
+            'ATU (Local Time)': atu.strftime(TIMESTAMP_FORMAT),
+            'Arrival Variance (within 4h target)': 'Y' if on_time else 'N',
+            'Arrival Accuracy (Final BTR)': 'Y' if on_time or rng.random() < 0.3 else 'N',
+            'Wait Time (Hours): ATB-BTR': wait,
+            'Wait Time (Hours): ABT-BTR': round(wait - atb_abt, 2),
+            'Wait Time (hours): ATB-ABT': atb_abt,
+            'Berth Time (hours): ATU - ATB': berth_time,
+            'Assured Port Time Achieved (%)': round(rng.uniform(60, 100), 1),
+            'Bunker Saved (USD)': round(rng.uniform(0, 70000), 2),
+            'Carbon Abatement (Tonnes)': round(rng.uniform(0, 1), 3),
+            'Year': atb.year,
+            'Month': atb.month
+        }
+        rows.append({f"data[{col}]": value for col, value in row.items()})
+
+    with _synthetic_lock:
+        _synthetic_cache[(n, seed)] = rows
+    return rows
+
+def fingerprint_row(rows: List[Dict]) -> Dict:
+    # Mirrors FINGERPRINT_QUERY over the synthetic rows.
+    operators = {}
+    for row in rows:
+        operators[row["data[Operator]"]] = operators.get(row["data[Operator]"], 0) + 1
+    return {
+        "[Rows]": len(rows),
+        "[MaxATU]": max((row["data[ATU (Local Time)]"] for row in rows), default=None),
+        "[MaxYear]": max((row["data[Year]"] for row in rows), default=None),
+        "[MaxMonth]": max((row["data[Month]"] for row in rows), default=None),
+        "[BunkerSaved]": sum(row["data[Bunker Saved (USD)]"] for row in rows),
+        "[CarbonAbatement]": sum(row["data[Carbon Abatement (Tonnes)]"] for row in rows),
+        "[WaitTime]": sum(row["data[Wait Time (Hours): ATB-BTR]"] for row in rows),
+        "[BerthTime]": sum(row["data[Berth Time (hours): ATU - ATB]"] for row in rows),
+        "[AccurateArrivals]": sum(row["data[Arrival Accuracy (Final BTR)]"] == "Y" for row in rows),
+        "[OnTimeArrivals]": sum(row["data[Arrival Variance (within 4h target)]"] == "Y" for row in rows),
+        "[Operators]": ",".join(f"{operator}:{count}" for operator, count in sorted(operators.items()))
+    }
+
+def resize_rows(rows: List[Dict], n: int) -> List[Dict]:
+    if not rows or len(rows) == n:
+        return rows
+    repeats = n // len(rows) + 1
+    return (rows * repeats)[:n]
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+class CassetteStore:
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, kind: str, key: str) -> Path:
+        return self.directory / f"{kind}_{hashlib.sha256(key.encode()).hexdigest()[:16]}.json"
+
+    def save(self, kind: str, key: str, record: Dict):
+        record = dict(record, kind=kind, key=key, recorded_at=datetime.now().isoformat())
+        with self._lock:
+            self._path(kind, key).write_text(json.dumps(record, indent=2))
+
+    def load(self, kind: str, key: str) -> Optional[Dict]:
+        path = self._path(kind, key)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = "PRAXISStandIn/1.0"
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    @property
+    def settings(self) -> StandInConfig:
+        return self.server.settings
+
+    def do_GET(self):
+        self._dispatch()
+
+    def do_POST(self):
+        self._dispatch()
+
+    def _dispatch(self):
+        path = urlsplit(self.path).path
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        self.body = self.rfile.read(length) if length else b""
+
+        if (QUERY_PATH.match(path) or CHAT_PATH.match(path)) and not self._body_is_json():
+            self._send_json(400, {"error": {"code": "BadRequest", "message": "Request body is not valid JSON"}})
+            return
+
+        if TOKEN_PATH.match(path):
+            kind, key = "token", "token"
+        elif REPORT_PATH.match(path):
+            kind, key = "report", path
+        elif QUERY_PATH.match(path):
+            query = json.loads(self.body or b"{}").get("queries", [{}])[0].get("query", "")
+            kind, key = "query", normalize_query(query)
+        elif CHAT_PATH.match(path):
+            payload = json.loads(self.body or b"{}")
+            kind, key = "chat", json.dumps({
+                'messages': payload.get('messages'),
+                'stream': bool(payload.get('stream')),
+                'response_format': payload.get('response_format')
+            }, sort_keys=True)
+        else:
+            self._send_json(404, {"error": {"code": "NotFound", "message": f"No stand-in route for {path}"}})
+            return
+
+        self.server.record_request(kind)
+
+        try:
+            if self.settings.mode == "record":
+                self._record(kind, key)
+            else:
+                self._replay(kind, key)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"Client disconnected during {kind} response")
+
+    def _body_is_json(self) -> bool:
+        try:
+            return isinstance(json.loads(self.body or b"{}"), dict)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return False
+
+    def _upstream_url(self, kind: str) -> str:
+        if kind == "token":
+            return f"{PowerBIConfig().authority_url}{self.path}"
+        if kind == "chat":
+            return f"{AzureGPTConfig().endpoint.rstrip('/')}{self.path}"
+        return f"{PowerBIConfig().api_base_url.rsplit('/v1.0', 1)[0]}{self.path}"
+
+    def _record(self, kind: str, key: str):
+        headers = {h: self.headers[h] for h in ('Authorization', 'api-key', 'Content-Type') if self.headers.get(h)}
+        stream = kind == "chat" and json.loads(self.body or b"{}").get("stream")
+
+        upstream = requests.request(
+            self.command, self._upstream_url(kind),
+            headers=headers, data=self.body or None,
+            stream=bool(stream), timeout=60
+        )
+
+        if stream and upstream.status_code == 200:
+            self._start_sse()
+            chunks = []
+            for line in upstream.iter_lines(decode_unicode=True):
+                if line:
+                    chunks.append(line)
+                    self._write_sse_line(line)
+            self.server.cassettes.save(kind, key, {"status": 200, "chunks": chunks})
+            return
+
+        record = {"status": upstream.status_code, "body": upstream.text}
+        if upstream.status_code == 200 and kind != "token":
+            self.server.cassettes.save(kind, key, record)
+        self._send_raw(upstream.status_code, upstream.text)
+
+    def _replay(self, kind: str, key: str):
+        self._inject_latency()
+
+        if kind != "token" and self.server.should_throttle():
+            self.server.record_throttle()
+            self._send_json(429, {"error": {"code": "TooManyRequests", "message": "Rate limit injected by stand-in"}},
+                            extra_headers={"Retry-After": str(self.settings.retry_after_seconds)})
+            return
+
+        record = self.server.cassettes.load(kind, key)
+
+        if kind == "chat":
+            self._replay_chat(record)
+        elif record is not None:
+            body = record["body"]
+            # Only the full table scales with result_rows; filtered and aggregate
+            # answers are replayed exactly as recorded.
+            if kind == "query" and key == FULL_TABLE_QUERY:
+                body = self._resize_query_body(body)
+            self._send_raw(record["status"], body)
+        elif kind == "token":
+            self._send_json(200, {"token_type": "Bearer", "expires_in": 3599, "ext_expires_in": 3599,
+                                  "access_token": f"standin-{random.getrandbits(64):016x}"})
+        elif kind == "report":
+            self._send_json(200, {"id": self.path.rsplit('/', 1)[-1], "name": "PRAXIS Stand-in",
+                                  "datasetId": "standin-dataset"})
+        else:
+            self._replay_query(key)
+
+    def _inject_latency(self):
+        delay = self.settings.latency_ms
+        if self.settings.jitter_ms:
+            delay += self.server.random_uniform(-self.settings.jitter_ms, self.settings.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _resize_query_body(self, body: str) -> str:
+        data = json.loads(body)
+        table = data["results"][0]["tables"][0]
+        if len(table["rows"]) > 1:
+            table["rows"] = resize_rows(table["rows"], self.settings.result_rows)
+        return json.dumps(data)
+
+    def _table_rows(self) -> List[Dict]:
+        # Fingerprints, pages and column reads come from the same rows the full
+        # table replays: the recorded table when there is one, else synthetic rows.
+        record = self.server.cassettes.load("query", FULL_TABLE_QUERY)
+        if record is not None and record["status"] == 200:
+            rows = json.loads(record["body"])["results"][0]["tables"][0]["rows"]
+            return resize_rows(rows, self.settings.result_rows) if len(rows) > 1 else rows
+        return synthesize_rows(self.settings.result_rows, self.settings.seed)
+
+    def _replay_query(self, query: str):
+        rows = self._table_rows()
+
+        if query == FULL_TABLE_QUERY:
+            result = rows
+        elif query == normalize_query(FINGERPRINT_QUERY):
+            result = [fingerprint_row(rows)]
+        elif PAGE_FILTER.search(query):
+            # Pages slice the table rows in the order they are replayed.
+            page_rows, skip = (int(n) for n in PAGE_FILTER.search(query).groups())
+            result = rows[skip:skip + page_rows]
+        elif query.startswith("EVALUATE SELECTCOLUMNS('Data'"):
+            columns = SELECTED_COLUMNS.findall(query)
+            result = [{f"[{col}]": row.get(f"data[{col}]") for col in columns} for row in rows]
+        elif OPERATOR_FILTER.search(query):
+            operator = OPERATOR_FILTER.search(query).group(1)
+            result = [row for row in rows if row["data[Operator]"] == operator]
+        else:
+            self._send_json(400, {"error": {"code": "StandInNoRecording",
+                                            "message": f"No recording or synthetic answer for query: {query[:200]}"}})
+            return
+
+        self._send_json(200, {"results": [{"tables": [{"rows": result}]}]})
+
+    def _replay_chat(self, record: Optional[Dict]):
+        payload = json.loads(self.body or b"{}")
+
+        if record is not None and "chunks" in record:
+            self._start_sse()
+            for line in record["chunks"]:
+                self._write_sse_line(line)
+            return
+        if record is not None:
+            self._send_raw(record["status"], record["body"])
+            return
+
+        content = self._synthesize_answer(payload)
+        prompt_tokens = sum(len(m.get('content', '')) for m in payload.get('messages', [])) // 4
+        completion_tokens = len(content) // 4
+
+        if payload.get("stream"):
+            self._start_sse()
+            words = content.split(' ')
+            for i, word in enumerate(words):
+                delta = word if i == 0 else f" {word}"
+                self._write_sse_line("data: " + json.dumps({
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+                }))
+            self._write_sse_line("data: [DONE]")
+            return
+
+        self._send_json(200, {
+            "object": "chat.completion",
+            "model": "standin",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    def _synthesize_answer(self, payload: Dict) -> str:
+        question = payload.get('messages', [{}])[-1].get('content', '')
+        if payload.get('response_format', {}).get('type') == 'json_object':
+            return self._synthesize_json(question)
+        return (
+            "Stand-in analysis: average wait time and DIS scores are within expected ranges. "
+            f"The request carried {len(question)} characters of context.\n"
+            "1. Prioritise vessels with the lowest DIS scores for berth planning.\n"
+            "2. Share arrival accuracy targets with operators below 60% on-time.\n"
+            "3. Extend bunker-saving practices from the top environmental performers."
+        )
+
+    def _synthesize_json(self, question: str) -> str:
+        # Batched prompts end with "Entities: {...}"; answer each key, leaving out
+        # every Nth one when json_omit_every is set so clients exercise re-requests.
+        try:
+            entities = json.loads(question[question.index('{'):question.rindex('}') + 1])
+        except ValueError:
+            return "{}"
+        omit = self.settings.json_omit_every
+        answers = {}
+        for i, (key, stats) in enumerate(entities.items(), 1):
+            if omit and i % omit == 0:
+                continue
+            figures = ", ".join(f"{name.replace('_', ' ')} {value}" for name, value in stats.items())
+            answers[key] = f"Stand-in narrative for {key}: {figures}."
+        return json.dumps(answers)
+
+    def _send_raw(self, status: int, body: str, extra_headers: Optional[Dict[str, str]] = None):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for header, value in (extra_headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status: int, payload: Dict, extra_headers: Optional[Dict[str, str]] = None):
+        self._send_raw(status, json.dumps(payload), extra_headers)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _write_sse_line(self, line: str):
+        if self.settings.mode == "replay" and self.settings.stream_chunk_ms:
+            time.sleep(self.settings.stream_chunk_ms / 1000)
+        self.wfile.write(f"{line}\n\n".encode())
+        self.wfile.flush()
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, settings: Optional[StandInConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), StandInHandler)
+        self.settings = settings or standin_config
+        self.cassettes = CassetteStore(self.settings.cassette_dir)
+        self.stats = {'requests': {}, 'throttled': 0}
+        self._rng = random.Random(self.settings.seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def random_uniform(self, low: float, high: float) -> float:
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+    def should_throttle(self) -> bool:
+        if self.settings.rate_limit_ratio <= 0:
+            return False
+        with self._lock:
+            return self._rng.random() < self.settings.rate_limit_ratio
+
+    def record_request(self, kind: str):
+        with self._lock:
+            self.stats['requests'][kind] = self.stats['requests'].get(kind, 0) + 1
+
+    def record_throttle(self):
+        with self._lock:
+            self.stats['throttled'] += 1
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="PRAXIS local stand-in for Power BI and Azure OpenAI")
+    parser.add_argument("--mode", choices=["record", "replay"], default=standin_config.mode)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cassette-dir", default=standin_config.cassette_dir)
+    parser.add_argument("--latency-ms", type=float, default=standin_config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=standin_config.jitter_ms)
+    parser.add_argument("--rate-limit", type=float, default=standin_config.rate_limit_ratio,
+                        help="Fraction of replayed requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=standin_config.retry_after_seconds)
+    parser.add_argument("--rows", type=int, default=standin_config.result_rows,
+                        help="Row count returned for table queries")
+    parser.add_argument("--stream-chunk-ms", type=float, default=standin_config.stream_chunk_ms)
+    parser.add_argument("--json-omit-every", type=int, default=standin_config.json_omit_every,
+                        help="Leave every Nth entity out of batched JSON answers")
+    parser.add_argument("--seed", type=int, default=standin_config.seed)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    settings = StandInConfig(
+        url="", mode=args.mode, cassette_dir=args.cassette_dir,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        rate_limit_ratio=args.rate_limit, retry_after_seconds=args.retry_after,
+        result_rows=args.rows, stream_chunk_ms=args.stream_chunk_ms,
+        json_omit_every=args.json_omit_every, seed=args.seed
+    )
+    server = StandInServer(settings, args.host, args.port)
+    logger.info(f"PRAXIS stand-in ({args.mode}) listening on {server.url}")
+    logger.info(f"Point clients at it with PRAXIS_STANDIN_URL={server.url}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"Stand-in stopped. Requests served: {server.stats}")
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
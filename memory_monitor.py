@@ -0,0 +1,92 @@
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from config import MemoryConfig, memory_config
+
+MB = 1024 * 1024
+
+def rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == 'darwin' else peak / 1024
+
+class MemoryMonitor:
+    def __init__(self, config: Optional[MemoryConfig] = None):
+        self.config = config or memory_config
+        self.stages: Dict[str, Dict] = {}
+        self._started_tracing = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.profile
+
+    def start(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        self.start()
+        rss_before = rss_mb()
+        traced_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.take_snapshot() if self.config.snapshot_top else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            traced_after, traced_peak = tracemalloc.get_traced_memory()
+            rss_after = rss_mb()
+            self.stages[name] = {
+                'seconds': round(time.perf_counter() - start, 3),
+                'rss_mb': round(rss_after, 1),
+                'rss_delta_mb': round(rss_after - rss_before, 1),
+                'traced_delta_mb': round((traced_after - traced_before) / MB, 1),
+                'traced_peak_mb': round((traced_peak - traced_before) / MB, 1),
+                'top_allocations': self._top_allocations(snapshot) if snapshot else []
+            }
+
+    def _top_allocations(self, before: tracemalloc.Snapshot) -> List[str]:
+        after = tracemalloc.take_snapshot()
+        return [str(stat) for stat in after.compare_to(before, 'lineno')[:self.config.snapshot_top]]
+
+    def describe(self, name: str) -> str:
+        stats = self.stages.get(name)
+        if stats is None:
+            return ""
+        return (f" [memory: RSS {stats['rss_mb']}MB ({stats['rss_delta_mb']:+}MB), "
+                f"traced {stats['traced_delta_mb']:+}MB, stage peak {stats['traced_peak_mb']}MB]")
+
+    def projected_rows_mb(self, rows: int) -> float:
+        # Analysis adds five float columns and row-wise temporaries on top of the rows themselves.
+        return rss_mb() + rows * self.config.row_bytes / MB * self.config.analysis_overhead
+
+    def rows_over_budget(self, rows: int) -> bool:
+        # Checked against the fingerprint row count, before anything is downloaded.
+        return self.config.budget_mb > 0 and self.projected_rows_mb(rows) > self.config.budget_mb
@@ -1,26 +1,67 @@
+import hashlib
+import json
+import threading
 import requests
 import pandas as pd
 from msal import ConfidentialClientApplication
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterator, List, Tuple
 from datetime import datetime, timedelta
-from config import powerbi_config
+from config import PowerBIConfig, powerbi_config
+from single_flight import get_flight, flight_key
+from warmup import content_version
+
+# One aggregate per DIS input, so a correction to any scored column changes the version.
+FINGERPRINT_QUERY = """
+EVALUATE
+ROW(
+    "Rows", COUNTROWS('Data'),
+    "MaxATU", MAX('Data'[ATU (Local Time)]),
+    "MaxYear", MAX('Data'[Year]),
+    "MaxMonth", MAX('Data'[Month]),
+    "BunkerSaved", SUM('Data'[Bunker Saved (USD)]),
+    "CarbonAbatement", SUM('Data'[Carbon Abatement (Tonnes)]),
+    "WaitTime", SUM('Data'[Wait Time (Hours): ATB-BTR]),
+    "BerthTime", SUM('Data'[Berth Time (hours): ATU - ATB]),
+    "AccurateArrivals", COUNTROWS(FILTER('Data', 'Data'[Arrival Accuracy (Final BTR)] = "Y")),
+    "OnTimeArrivals", COUNTROWS(FILTER('Data', 'Data'[Arrival Variance (within 4h target)] = "Y")),
+    "Operators", CONCATENATEX(VALUES('Data'[Operator]), 'Data'[Operator] & ":" & CALCULATE(COUNTROWS('Data')), ",", 'Data'[Operator], ASC)
+)
+"""
+FINGERPRINT_SUMS = ['BunkerSaved', 'CarbonAbatement', 'WaitTime', 'BerthTime']
+# Downloads retried when the fingerprint moves while the table is being read.
+FETCH_ATTEMPTS = 3
+
+# Paged reads need a stable order; the call key makes each row's position deterministic.
+PAGE_QUERY = ("EVALUATE TOPNSKIP({rows}, {skip}, 'Data', "
+              "'Data'[Rotation No.], ASC, 'Data'[Vessel], ASC, 'Data'[ATB (Local Time)], ASC)")
+
+def fingerprint_version(fingerprint: Dict) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode()).hexdigest()[:16]
 
 class PowerBIConnector:
-    def __init__(self):
-        self.config = powerbi_config
+    def __init__(self, config: Optional[PowerBIConfig] = None):
+        self.config = config or powerbi_config
         self.access_token = None
         self.token_expires_at = None
-        self.base_url = "https://api.powerbi.com/v1.0/myorg"
+        self.base_url = self.config.api_base_url
         self.dataset_id = None
+        self.refresh_stats = {'fingerprints': 0, 'full_fetches': 0, 'skipped': 0, 'raced': 0}
+        self._stats_lock = threading.Lock()
         
-    def authenticate(self) -> str:
-        app = ConfidentialClientApplication(
-            self.config.client_id,
-            authority=f"{self.config.authority_url}/{self.config.tenant_id}",
-            client_credential=self.config.client_secret
-        )
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.refresh_stats[name] += 1
         
-        result = app.acquire_token_for_client(scopes=self.config.scope)
+    def authenticate(self) -> str:
+        if self.config.use_msal:
+            app = ConfidentialClientApplication(
+                self.config.client_id,
+                authority=f"{self.config.authority_url}/{self.config.tenant_id}",
+                client_credential=self.config.client_secret
+            )
+            result = app.acquire_token_for_client(scopes=self.config.scope)
+        else:
+            result = self._acquire_token_direct()
         
         if "access_token" in result:
             self.access_token = result["access_token"]
@@ -29,6 +70,18 @@ class PowerBIConnector:
             return self.access_token
         raise Exception(f"Authentication failed: {result.get('error_description')}")
     
+    def _acquire_token_direct(self) -> Dict:
+        # MSAL only accepts https authorities, so plain-http endpoints such as
+        # the local stand-in get the client-credentials grant posted directly.
+        token_url = f"{self.config.authority_url}/{self.config.tenant_id}/oauth2/v2.0/token"
+        response = requests.post(token_url, data={
+            "grant_type": "client_credentials",
+            "client_id": self.config.client_id,
+            "client_secret": self.config.client_secret,
+            "scope": " ".join(self.config.scope)
+        })
+        return response.json()
+    
     def _ensure_valid_token(self):
         if not self.access_token or not self.token_expires_at:
             self.authenticate()
@@ -56,6 +109,14 @@ class PowerBIConnector:
         return self.dataset_id
     
     def execute_dax_query(self, dax_query: str) -> pd.DataFrame:
+        # Identical queries already in flight (e.g. several sessions refreshing
+        # after cache expiry) share one request; each caller gets its own copy
+        # because the decision engine adds score columns in place.
+        key = flight_key(self.config.workspace_id, self.config.report_id, dax_query)
+        df, shared = get_flight("powerbi").do(key, lambda: self._execute_dax_query(dax_query))
+        return df.copy() if shared else df
+    
+    def _execute_dax_query(self, dax_query: str) -> pd.DataFrame:
         dataset_id = self._get_dataset_id()
         url = f"{self.base_url}/groups/{self.config.workspace_id}/datasets/{dataset_id}/executeQueries"
         
@@ -84,6 +145,73 @@ class PowerBIConnector:
         
         return self.execute_dax_query(query)
     
+    def get_fingerprint(self) -> Dict:
+        row = self.execute_dax_query(FINGERPRINT_QUERY).iloc[0]
+        fingerprint = {col.strip('[]'): (value.item() if hasattr(value, 'item') else value) for col, value in row.items()}
+        # Rounded so a different summation order on the server does not change the version.
+        for name in FINGERPRINT_SUMS:
+            fingerprint[name] = round(float(fingerprint[name] or 0), 4)
+        return fingerprint
+    
+    def get_dataset_version(self) -> str:
+        self._count('fingerprints')
+        return fingerprint_version(self.get_fingerprint())
+    
+    def get_columns(self, columns: List[str]) -> pd.DataFrame:
+        selected = ", ".join(f'"{col}", \'Data\'[{col}]' for col in columns)
+        df = self.execute_dax_query(f"EVALUATE SELECTCOLUMNS('Data', {selected})")
+        df.columns = [col.strip('[]') for col in df.columns]
+        return df
+    
+    def iter_data_pages(self, total_rows: int, page_rows: int, version: Optional[str] = None) -> Iterator[pd.DataFrame]:
+        # Large tables are read a page at a time so only one page is held in memory.
+        self._count('full_fetches')
+        for skip in range(0, total_rows, page_rows):
+            df = self.execute_dax_query(PAGE_QUERY.format(rows=page_rows, skip=skip))
+            if version:
+                df.attrs['dataset_version'] = version
+            yield df
+    
+    def fingerprint_if_changed(self, known_version: Optional[str] = None) -> Tuple[str, Optional[Dict]]:
+        # The fingerprint (None when the version is unchanged) also carries the row
+        # count, so callers can size the download before starting it.
+        self._count('fingerprints')
+        fingerprint = self.get_fingerprint()
+        version = fingerprint_version(fingerprint)
+        if version == known_version:
+            self._count('skipped')
+            return version, None
+        return version, fingerprint
+    
+    def confirm_version(self, version: str) -> Tuple[bool, str]:
+        # Re-read after a download: a refresh that landed meanwhile may have left
+        # the rows mixing both versions.
+        latest = self.get_dataset_version()
+        if latest != version:
+            self._count('raced')
+        return latest == version, latest
+    
+    def fetch_version(self, version: str) -> Tuple[str, pd.DataFrame]:
+        for _ in range(FETCH_ATTEMPTS):
+            self._count('full_fetches')
+            df = self.get_operator_data()
+            confirmed, version = self.confirm_version(version)
+            if confirmed:
+                break
+        else:
+            # Still changing: label the rows by content so the next check downloads again.
+            version = content_version(df)
+        df.attrs['dataset_version'] = version
+        return version, df
+    
+    def fetch_if_changed(self, known_version: Optional[str] = None) -> Tuple[str, Optional[pd.DataFrame]]:
+        # A one-row fingerprint query decides whether the full table needs downloading;
+        # the returned frame (None when unchanged) carries the version in attrs.
+        version, fingerprint = self.fingerprint_if_changed(known_version)
+        if fingerprint is None:
+            return version, None
+        return self.fetch_version(version)
+    
     def get_key_metrics(self) -> Dict[str, float]:
         query = """
         EVALUATE 
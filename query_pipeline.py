@@ -0,0 +1,355 @@
+import threading
+import time
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Tuple
+from powerbi_connector import PowerBIConnector
+from decision_engine import DecisionEngine
+from conversation_manager import ConversationManager
+from evaluation_system import EvaluationSystem
+from llm_client import LLMClient, SYSTEM_MESSAGE
+from single_flight import flight_key
+from warmup import AnswerCache, content_version, pregenerate_narratives
+from forecasting import ForecastEngine
+from anomaly_detector import AnomalyDetector
+from berth_index import BerthIndex, add_berth_congestion
+from vessel_index import VesselIndex
+from config import warmup_config
+
+# Sessions share column buffers through shallow copies. pandas 3 always copies on
+# write; pandas 2 only does once the option is set.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+SAMPLE_QUESTIONS = [
+    "Compare GRN and NVX operator performance",
+    "Show top 5 vessels by efficiency",
+    "What are the main delay factors?",
+    "Which operators have best carbon performance?",
+    "Recommend improvements for wait time reduction"
+]
+
+STAGES = ['intent', 'fetch', 'scoring', 'prompt', 'llm', 'recommendations']
+
+class QueryPipeline:
+    def __init__(self, pbi: PowerBIConnector, engine: DecisionEngine, conv_mgr: ConversationManager,
+                 eval_sys: EvaluationSystem, llm: LLMClient, answer_cache: Optional[AnswerCache] = None):
+        self.pbi = pbi
+        self.engine = engine
+        self.conv_mgr = conv_mgr
+        self.eval_sys = eval_sys
+        self.llm = llm
+        self.answer_cache = answer_cache or AnswerCache(top_k=warmup_config.top_k)
+        self.forecaster = ForecastEngine()
+        self.detector = AnomalyDetector()
+        self._indexes: Dict[type, object] = {}
+        self._dataset: Optional[pd.DataFrame] = None
+        self._dataset_lock = threading.Lock()
+        self.detector_sync: Optional[threading.Thread] = None
+        self.warmup: Optional[threading.Thread] = None
+
+    def fetch_data(self) -> pd.DataFrame:
+        with self._dataset_lock:
+            shared = self._dataset
+        known_version = shared.attrs.get('dataset_version') if shared is not None else None
+        version, df = self.pbi.fetch_if_changed(known_version)
+        if df is None:
+            # Sessions share the columns of an unchanged dataset; copy-on-write keeps their edits private.
+            return shared.copy(deep=False)
+
+        add_berth_congestion(df, self.berth_index(df))
+        self.sync_detector(df, version)
+        with self._dataset_lock:
+            self._dataset = df
+        if warmup_config.enabled:
+            self.warm_up(df, version)
+        return df.copy(deep=False)
+
+    def _index_for(self, index_class: type, df: pd.DataFrame):
+        version = df.attrs.get('dataset_version') or content_version(df)
+        index = self._indexes.get(index_class)
+        if index is None or index.version != version:
+            index = self._indexes[index_class] = index_class(df, version)
+        return index
+
+    def berth_index(self, df: pd.DataFrame) -> BerthIndex:
+        return self._index_for(BerthIndex, df)
+
+    def vessel_index(self, df: pd.DataFrame) -> VesselIndex:
+        return self._index_for(VesselIndex, df)
+
+    def sync_detector(self, df: pd.DataFrame, version: str) -> threading.Thread:
+        # Replaying a refreshed dataset through the detector takes seconds on large
+        # tables, so it runs off the request path; chats read the current ranking.
+        self.detector_sync = threading.Thread(target=self.detector.sync, args=(df, version),
+                                              name="praxis-anomaly-sync", daemon=True)
+        self.detector_sync.start()
+        return self.detector_sync
+
+    def warm_up(self, df: pd.DataFrame, version: str) -> threading.Thread:
+        # Scoring every strategy and fitting forecasts also takes seconds, so it runs
+        # beside the detector sync; lookups miss and chats answer live until it lands.
+        self.answer_cache.expect(version)
+        self.warmup = threading.Thread(target=self._warm, args=(df, version), name="praxis-warmup", daemon=True)
+        self.warmup.start()
+        return self.warmup
+
+    def _warm(self, df: pd.DataFrame, version: str):
+        self.forecaster.get_forecasts(df, version)
+        if self.answer_cache.warm(df, version) and warmup_config.pregenerate_narratives:
+            pregenerate_narratives(self.answer_cache, version, self.llm, self._narrative_prompts(df))
+
+    def _narrative_prompts(self, df: pd.DataFrame) -> List[Tuple[str, str, str]]:
+        prompts = []
+        for question in SAMPLE_QUESTIONS:
+            fresh_session = ConversationManager()
+            intent = fresh_session.infer_intent(question)
+            prompt = fresh_session.build_prompt(question, self.build_data_summary(intent, df, question))
+            prompts.append((flight_key(SYSTEM_MESSAGE, prompt), prompt, SYSTEM_MESSAGE))
+        return prompts
+
+    def _cache_scope(self, intent: Dict) -> Tuple[bool, Optional[str]]:
+        operators = intent['entities']['operators']
+        if len(operators) > 1:
+            return False, None
+        return True, operators[0] if operators else None
+
+    def build_data_summary(self, intent: Dict, df: pd.DataFrame, question: str = "",
+                           engine: Optional[DecisionEngine] = None) -> str:
+        engine = engine or self.engine
+        version = df.attrs.get('dataset_version')
+        operators = intent['entities']['operators']
+        cacheable, scope = self._cache_scope(intent)
+
+        if operators:
+            df_filtered = df[df['Operator'].isin(operators)]
+        else:
+            df_filtered = df
+
+        if intent['entities'].get('vessels'):
+            return self.vessel_drilldown(intent['entities']['vessels'], df, engine)
+        elif intent['type'] == 'comparison' and len(operators) >= 2:
+            comparison = self.answer_cache.comparison(version, engine.strategy, operators)
+            if comparison is None:
+                comparison = engine.compare_operators(df, operators)
+            return f"Operator Comparison:\n{comparison}"
+        elif intent['type'] == 'ranking' and intent['entities'].get('pareto'):
+            # Fronts are only sorted in the background warm-up. Until it lands, answer
+            # with the DIS ranking instead of sorting on the request path.
+            bus = [] if operators else self._mentioned_bus(df, question)
+            scopes = [(op, None) for op in operators] or [(None, bu) for bu in bus] or [(None, None)]
+            cached = [self.answer_cache.pareto(version, engine.strategy, 10, op, bu) for op, bu in scopes]
+            if any(entry is None for entry in cached):
+                return (f"Top Performers (Pareto front not computed yet for this dataset):\n"
+                        f"{engine.get_top_performers(df_filtered).to_string()}")
+            front = pd.concat([entry[0] for entry in cached]).nlargest(10, 'DIS_Score')
+            scope_label = ", ".join(operators or bus) or "all calls"
+            return (f"Pareto Front for {scope_label} (calls not dominated on time, cost, environment and risk):\n"
+                    f"{front.to_string()}\n\nOperator Skyline (rank 1 = not dominated):\n{cached[0][1].to_string()}")
+        elif intent['type'] == 'ranking':
+            top_performers = None
+            if cacheable:
+                top_performers = self.answer_cache.top_performers(version, engine.strategy, 5, scope)
+            if top_performers is None:
+                top_performers = engine.get_top_performers(df_filtered)
+            return f"Top Performers:\n{top_performers.to_string()}"
+        elif intent['type'] == 'prediction':
+            return self.forecaster.summarize(df, intent, question)
+
+        stats = self._summary_stats(intent, df, engine)
+        bus = self._mentioned_bus(df, question)
+        return f"Analysis Summary:\n{stats}\n\nBerth Congestion:\n{self.berth_index(df).summary(bus)}"
+
+    def _mentioned_bus(self, df: pd.DataFrame, question: str) -> List[str]:
+        return [bu for bu in self.berth_index(df).alongside if bu.upper() in question.upper()]
+
+    def _summary_stats(self, intent: Dict, df: pd.DataFrame, engine: DecisionEngine) -> Dict:
+        operators = intent['entities']['operators']
+        cacheable, scope = self._cache_scope(intent)
+        stats = None
+        if cacheable:
+            stats = self.answer_cache.summary(df.attrs.get('dataset_version'), engine.strategy, scope)
+        if stats is None:
+            df_filtered = df[df['Operator'].isin(operators)] if operators else df
+            stats = engine.summarize(engine.analyze_dataframe(df_filtered.head(50)))
+        return stats
+
+    def fallback_answer(self, intent: Dict, df: pd.DataFrame, engine: Optional[DecisionEngine] = None) -> str:
+        engine = engine or self.engine
+        # Served when the LLM misses its deadline. The figures are stated as facts, so
+        # they cover every call in scope rather than the prompt's first rows.
+        operators = intent['entities']['operators']
+        cacheable, scope = self._cache_scope(intent)
+        stats = self.answer_cache.totals(df.attrs.get('dataset_version'), engine.strategy, scope) if cacheable else None
+        if stats is None:
+            df_filtered = df[df['Operator'].isin(operators)] if operators else df
+            stats = engine.summarize(engine.analyze_dataframe(df_filtered.copy()))
+        label = ', '.join(operators) if operators else 'all operators'
+        answer = (f"Live narrative unavailable, showing the latest computed figures for {label}: "
+                  f"{stats['total_vessels']} vessel calls, average DIS {stats['avg_dis']}, "
+                  f"average wait {stats['avg_wait_time']}h, on-time arrival rate {stats['on_time_rate']}%, "
+                  f"total bunker saved ${stats['total_bunker_saved']:,.2f}.")
+        recommendations = self._recommendations(intent, df, engine)
+        if recommendations:
+            answer += f" Key finding: {recommendations[0]}"
+        return answer
+
+    def vessel_drilldown(self, vessels: List[str], df: pd.DataFrame, engine: Optional[DecisionEngine] = None) -> str:
+        engine = engine or self.engine
+        index = self.vessel_index(df)
+        lines = ["Vessel DIS Breakdown (latest call):"]
+        for reference in vessels[:3]:
+            positions = index.lookup(reference)
+            if not positions:
+                continue
+            row = df.iloc[positions[-1]]
+            breakdown = engine.explain_dis(row)
+            parts = " + ".join(
+                f"{name} {score} x {breakdown['weights'][name]}" for name, score in breakdown['components'].items()
+            )
+            lines.append(
+                f"- {row.get('Vessel')} (IMO {row.get('IMO')}, rotation {row.get('Rotation No.')}, "
+                f"{row.get('Operator')}, {row.get('BU')}, ATB {row.get('ATB (Local Time)')}): "
+                f"DIS {breakdown['dis']} = {parts}; wait {row.get('Wait Time (Hours): ATB-BTR')}h, "
+                f"berth {row.get('Berth Time (hours): ATU - ATB')}h; {len(positions)} calls in dataset"
+            )
+        return "\n".join(lines)
+
+    def _recommendations(self, intent: Dict, df: pd.DataFrame, engine: DecisionEngine) -> List[str]:
+        operators = intent['entities']['operators']
+        anomalies = self.detector.top_anomalies(3, operators)
+
+        cacheable, scope = self._cache_scope(intent)
+        if cacheable:
+            cached = self.answer_cache.recommendations(df.attrs.get('dataset_version'), engine.strategy, scope)
+            if cached is not None:
+                if anomalies:
+                    cached.insert(0, engine.outlier_recommendation(anomalies))
+                return cached
+
+        if operators:
+            df_filtered = df[df['Operator'].isin(operators)]
+        else:
+            df_filtered = df
+        return engine.generate_recommendations(df_filtered, anomalies=anomalies)
+
+    def _prepare(self, prompt: str, df: Optional[pd.DataFrame], conv_mgr: ConversationManager,
+                 stage_times: Dict, engine: DecisionEngine) -> Tuple[Dict, pd.DataFrame, str]:
+        stage_start = time.perf_counter()
+        intent = conv_mgr.infer_intent(prompt)
+        stage_times['intent'] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        if df is None:
+            df = self.fetch_data()
+        stage_times['fetch'] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        intent['entities']['vessels'] = self.vessel_index(df).find_in_text(prompt)
+        conv_mgr.mention_vessels(intent['entities']['vessels'])
+        stage_times['intent'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        data_summary = self.build_data_summary(intent, df, prompt, engine)
+        stage_times['scoring'] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        full_prompt = conv_mgr.build_prompt(prompt, data_summary)
+        stage_times['prompt'] = time.perf_counter() - stage_start
+
+        return intent, df, full_prompt
+
+    def _finish(self, prompt: str, intent: Dict, df: pd.DataFrame, response: Dict, start_time: float,
+                conv_mgr: ConversationManager, stage_times: Dict, session_id: Optional[str],
+                engine: DecisionEngine) -> Dict:
+        if response['success'] or response.get('fallback'):
+            answer = response['content']
+        else:
+            answer = "Unable to generate response. Please try again."
+
+        stage_start = time.perf_counter()
+        recommendations = self._recommendations(intent, df, engine)
+        stage_times['recommendations'] = time.perf_counter() - stage_start
+
+        full_response = f"{answer}\n\n**Recommendations:**\n"
+        for i, rec in enumerate(recommendations[:3], 1):
+            full_response += f"{i}. {rec}\n"
+
+        response_time = self.eval_sys.end_query(start_time, session_id, response.get('tokens_used', 0))
+
+        quality = self.eval_sys.evaluate_answer_quality(
+            answer,
+            has_metrics='avg' in answer.lower() or 'total' in answer.lower(),
+            has_recommendations=len(recommendations) > 0
+        )
+
+        performance_data = {
+            'response_time': round(response_time, 2),
+            'quality_score': quality['quality_score'],
+            'tokens_used': response.get('tokens_used', 0),
+            'speedup_vs_manual': self.eval_sys.calculate_speedup(response_time)
+        }
+
+        conv_mgr.add_message("user", prompt)
+        conv_mgr.add_message("assistant", answer)
+
+        return {
+            'answer': answer,
+            'content': full_response,
+            'recommendations': recommendations,
+            'metrics': performance_data,
+            'stage_times': stage_times,
+            'llm_success': response['success'],
+            'llm_fallback': response.get('fallback', False),
+            'data': df
+        }
+
+    def handle_message(self, prompt: str, df: Optional[pd.DataFrame] = None,
+                       conv_mgr: Optional[ConversationManager] = None, session_id: Optional[str] = None,
+                       engine: Optional[DecisionEngine] = None) -> Dict:
+        # Sessions sharing this pipeline pass their own strategy's engine rather than
+        # re-weighting the shared one.
+        conv_mgr, engine = conv_mgr or self.conv_mgr, engine or self.engine
+        stage_times = {}
+        start_time = self.eval_sys.start_query()
+
+        intent, df, full_prompt = self._prepare(prompt, df, conv_mgr, stage_times, engine)
+
+        stage_start = time.perf_counter()
+        response = self.answer_cache.narrative(flight_key(SYSTEM_MESSAGE, full_prompt))
+        if response is None:
+            response = self.llm.generate_response(full_prompt, system_message=SYSTEM_MESSAGE,
+                                                  fallback=lambda: self.fallback_answer(intent, df, engine))
+        stage_times['llm'] = time.perf_counter() - stage_start
+
+        return self._finish(prompt, intent, df, response, start_time, conv_mgr, stage_times, session_id, engine)
+
+    def stream_message(self, prompt: str, df: Optional[pd.DataFrame] = None,
+                       conv_mgr: Optional[ConversationManager] = None, session_id: Optional[str] = None,
+                       engine: Optional[DecisionEngine] = None) -> Iterator[Dict]:
+        conv_mgr, engine = conv_mgr or self.conv_mgr, engine or self.engine
+        stage_times = {}
+        start_time = self.eval_sys.start_query()
+
+        intent, df, full_prompt = self._prepare(prompt, df, conv_mgr, stage_times, engine)
+
+        stage_start = time.perf_counter()
+        response = self.answer_cache.narrative(flight_key(SYSTEM_MESSAGE, full_prompt))
+        if response is not None:
+            yield {'type': 'delta', 'content': response['content']}
+        else:
+            chunks = []
+            try:
+                for delta in self.llm.stream_response(full_prompt, system_message=SYSTEM_MESSAGE):
+                    chunks.append(delta)
+                    yield {'type': 'delta', 'content': delta}
+            except Exception:
+                if chunks:
+                    raise
+            if chunks:
+                response = {'content': ''.join(chunks), 'success': True}
+            else:
+                response = self.llm.fallback_response(lambda: self.fallback_answer(intent, df, engine))
+                yield {'type': 'delta', 'content': response['content']}
+        stage_times['llm'] = time.perf_counter() - stage_start
+
+        yield {'type': 'result', **self._finish(prompt, intent, df, response, start_time, conv_mgr, stage_times, session_id, engine)}
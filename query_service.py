@@ -0,0 +1,401 @@
+"""
+PRAXIS - Query Service
+Headless async HTTP API over the conversation, decision and LLM components.
+
+    python query_service.py --port 8600 --workers 8 --queue-size 32
+
+Endpoints:
+    GET  /health
+    POST /ask              {"question": "...", "session_id": "...", "stream": false}
+    POST /compare          {"operators": ["GRN", "NVX"], "strategy": "balanced"}
+    GET  /top-k            ?k=5&strategy=balanced&operator=GRN
+    GET  /recommendations  ?strategy=balanced&operator=GRN
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+
+from config import QueryServiceConfig, service_config
+from powerbi_connector import PowerBIConnector
+from decision_engine import DecisionEngine
+from conversation_manager import ConversationManager
+from evaluation_system import EvaluationSystem
+from llm_client import LLMClient
+from query_pipeline import QueryPipeline
+from single_flight import coalescing_metrics
+from session_store import SessionStore
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ['balanced', 'carbon_reduction', 'cost_efficiency', 'reliability']
+
+STATUS_TEXT = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'
+}
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+class QueryService:
+    def __init__(self, pipeline: QueryPipeline, config: Optional[QueryServiceConfig] = None):
+        self.pipeline = pipeline
+        self.config = config or service_config
+        self.executor = ThreadPoolExecutor(max_workers=self.config.workers, thread_name_prefix="praxis-worker")
+        self.capacity = self.config.workers + self.config.queue_size
+        self.in_flight = 0
+        self.stats = {'requests': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+        self.started_at = time.time()
+        self.sessions = SessionStore()
+        self._engines_lock = threading.Lock()
+        self._engines: Dict[str, DecisionEngine] = {}
+        self._data = None
+        self._data_checked_at = 0.0
+        self._data_lock = threading.Lock()
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def get_data(self) -> pd.DataFrame:
+        with self._data_lock:
+            # fetch_data only downloads the table when the dataset fingerprint changed,
+            # so re-checking every data_refresh_seconds is cheap.
+            if self._data is None or time.monotonic() - self._data_checked_at >= self.config.data_refresh_seconds:
+                self._data = self.pipeline.fetch_data()
+                self._data_checked_at = time.monotonic()
+            # Engine analysis adds score columns in place; a shallow copy keeps
+            # concurrent workers from writing into the shared frame.
+            return self._data.copy(deep=False)
+
+    def engine_for(self, strategy: Optional[str]) -> DecisionEngine:
+        strategy = strategy or 'balanced'
+        if strategy not in STRATEGIES:
+            raise ServiceError(400, f"Unknown strategy '{strategy}'. Expected one of {STRATEGIES}")
+        with self._engines_lock:
+            if strategy not in self._engines:
+                self._engines[strategy] = DecisionEngine(strategy)
+            return self._engines[strategy]
+
+    @contextmanager
+    def session(self, session_id: Optional[str]) -> Iterator[ConversationManager]:
+        if not session_id:
+            yield ConversationManager()
+            return
+        with self.sessions.checkout(session_id) as conv_mgr:
+            yield conv_mgr
+
+    def _filter_operator(self, df: pd.DataFrame, operator: Optional[str]) -> pd.DataFrame:
+        if not operator:
+            return df
+        return df[df['Operator'] == operator.upper()]
+
+    def ask(self, body: Dict) -> Dict:
+        question = body.get('question')
+        if not question or not isinstance(question, str):
+            raise ServiceError(400, "Field 'question' is required")
+        session_id = body.get('session_id')
+        with self.session(session_id) as conv_mgr:
+            result = self.pipeline.handle_message(question, self.get_data(), conv_mgr, session_id)
+        return {k: v for k, v in result.items() if k != 'data'}
+
+    def compare(self, body: Dict) -> Dict:
+        operators = body.get('operators', [])
+        if not isinstance(operators, list) or not all(isinstance(op, str) for op in operators):
+            raise ServiceError(400, "Field 'operators' must be a list of operator codes")
+        operators = [op.upper() for op in operators]
+        if len(operators) < 2:
+            raise ServiceError(400, "Field 'operators' needs at least two operators")
+        engine = self.engine_for(body.get('strategy'))
+        data = self.get_data()
+        comparison = self.pipeline.answer_cache.comparison(data.attrs.get('dataset_version'), engine.strategy, operators)
+        if comparison is None:
+            comparison = engine.compare_operators(data, operators)
+        return {'comparison': comparison}
+
+    def top_k(self, query: Dict) -> Dict:
+        try:
+            k = int(query.get('k', 5))
+        except ValueError:
+            raise ServiceError(400, "Parameter 'k' must be an integer")
+        engine = self.engine_for(query.get('strategy'))
+        operator = query.get('operator', '').upper() or None
+        data = self.get_data()
+        top = self.pipeline.answer_cache.top_performers(data.attrs.get('dataset_version'), engine.strategy, k, operator)
+        if top is None:
+            top = engine.get_top_performers(self._filter_operator(data, operator), n=k)
+        return {'top_k': top.to_dict('records')}
+
+    def recommendations(self, query: Dict) -> Dict:
+        engine = self.engine_for(query.get('strategy'))
+        operator = query.get('operator', '').upper() or None
+        data = self.get_data()
+        cached = self.pipeline.answer_cache.recommendations(data.attrs.get('dataset_version'), engine.strategy, operator)
+        if cached is not None:
+            return {'recommendations': cached}
+        df = self._filter_operator(data, operator)
+        if df.empty:
+            raise ServiceError(404, f"No data for operator '{query.get('operator')}'")
+        return {'recommendations': engine.generate_recommendations(df)}
+
+    def health(self) -> Dict:
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'workers': self.config.workers,
+            'queue_size': self.config.queue_size,
+            'in_flight': self.in_flight,
+            'data_loaded': self._data is not None,
+            'records': len(self._data) if self._data is not None else 0,
+            'dataset_version': self._data.attrs.get('dataset_version') if self._data is not None else None,
+            'refresh': dict(self.pipeline.pbi.refresh_stats),
+            'sessions': self.sessions.get_stats(),
+            'requests': dict(self.stats),
+            'coalescing': coalescing_metrics(),
+            'answer_cache': self.pipeline.answer_cache.get_stats(),
+            'anomalies': self.pipeline.detector.get_stats(),
+            'llm': self.pipeline.llm.get_stats(),
+            'performance': self.pipeline.eval_sys.get_performance_summary(),
+            'rates': self.pipeline.eval_sys.get_real_time_metrics()
+        }
+
+    def _admit(self):
+        if self.in_flight >= self.capacity:
+            self.stats['rejected'] += 1
+            raise ServiceError(503, "Server busy, request queue is full")
+        self.in_flight += 1
+
+    def _release(self, _future=None):
+        self.in_flight -= 1
+
+    async def _run_bounded(self, fn: Callable, *args) -> Any:
+        self._admit()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        # The slot is only released when the worker actually finishes, so a
+        # timed-out request still counts against the queue until it drains.
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.config.request_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise ServiceError(504, f"Request exceeded {self.config.request_timeout_seconds}s timeout")
+
+    async def _stream_ask(self, writer: asyncio.StreamWriter, body: Dict):
+        question = body.get('question')
+        if not question or not isinstance(question, str):
+            raise ServiceError(400, "Field 'question' is required")
+
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        session_id = body.get('session_id')
+
+        def produce():
+            try:
+                with self.session(session_id) as conv_mgr:
+                    for event in self.pipeline.stream_message(question, self.get_data(), conv_mgr, session_id):
+                        event.pop('data', None)
+                        loop.call_soon_threadsafe(events.put_nowait, event)
+            except Exception as e:
+                loop.call_soon_threadsafe(events.put_nowait, {'type': 'error', 'message': str(e)})
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        self._admit()
+        loop.run_in_executor(self.executor, produce).add_done_callback(self._release)
+
+        writer.write(self._head(200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}))
+        deadline = loop.time() + self.config.request_timeout_seconds
+
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                event = {'type': 'error', 'message': f"Request exceeded {self.config.request_timeout_seconds}s timeout"}
+                writer.write(f"data: {json.dumps(event)}\n\n".encode())
+                break
+            if event is None:
+                writer.write(b"data: [DONE]\n\n")
+                break
+            writer.write(f"data: {json.dumps(event, default=str)}\n\n".encode())
+            await writer.drain()
+
+        await writer.drain()
+
+    async def _route(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter):
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == '/health':
+            # Session and SQLite stats block, so health runs on a worker like the other handlers.
+            await self._send_json(writer, 200, await self._run_bounded(self.health))
+            return
+
+        routes = {
+            '/ask': ('POST', self.ask),
+            '/compare': ('POST', self.compare),
+            '/top-k': ('GET', self.top_k),
+            '/recommendations': ('GET', self.recommendations)
+        }
+        if url.path not in routes:
+            raise ServiceError(404, f"Unknown endpoint {url.path}")
+
+        expected_method, handler = routes[url.path]
+        if method != expected_method:
+            raise ServiceError(405, f"{url.path} expects {expected_method}")
+
+        if method == 'POST':
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                raise ServiceError(400, "Request body must be JSON")
+            if not isinstance(payload, dict):
+                raise ServiceError(400, "Request body must be a JSON object")
+        else:
+            payload = query
+
+        if url.path == '/ask' and (payload.get('stream') or query.get('stream') in ('1', 'true')):
+            await self._stream_ask(writer, payload)
+            return
+
+        await self._send_json(writer, 200, await self._run_bounded(handler, payload))
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, bytes]]:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), self.config.request_timeout_seconds)
+            if not request_line:
+                return None
+            method, target, _ = request_line.decode('latin-1').split()
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0) or 0)
+            body = await reader.readexactly(length) if length else b""
+        except (ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            raise ServiceError(400, f"Malformed request: {e}")
+        return method.upper(), target, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await self._read_request(reader)
+            if request is None:
+                return
+            self.stats['requests'] += 1
+            await self._route(*request, writer)
+        except ServiceError as e:
+            extra = {"Retry-After": str(self.config.retry_after_seconds)} if e.status == 503 else None
+            await self._send_json(writer, e.status, {'error': str(e)}, extra)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.exception("Unhandled error in query service")
+            await self._send_json(writer, 500, {'error': str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _head(self, status: int, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append("Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict,
+                         extra_headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload, default=str).encode()
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(data))}
+        headers.update(extra_headers or {})
+        try:
+            writer.write(self._head(status, headers) + data)
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def serve_forever(self, host: Optional[str] = None, port: Optional[int] = None):
+        server = await asyncio.start_server(self._handle_connection, host or self.config.host,
+                                            self.config.port if port is None else port)
+        logger.info(f"PRAXIS query service listening on {server.sockets[0].getsockname()[:2]}")
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self, host: Optional[str] = None, port: int = 0) -> str:
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle_connection, host or self.config.host, port)
+            )
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        bound_host, bound_port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{bound_host}:{bound_port}"
+
+    def stop(self):
+        if self._loop:
+            async def close():
+                self._server.close()
+                await self._server.wait_closed()
+            asyncio.run_coroutine_threadsafe(close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+        self.executor.shutdown(wait=False)
+        self.sessions.close()
+
+def build_service(config: Optional[QueryServiceConfig] = None) -> QueryService:
+    pipeline = QueryPipeline(PowerBIConnector(), DecisionEngine(), ConversationManager(),
+                             EvaluationSystem(), LLMClient())
+    return QueryService(pipeline, config)
+
+def main():
+    parser = argparse.ArgumentParser(description="PRAXIS headless query service")
+    parser.add_argument("--host", default=service_config.host)
+    parser.add_argument("--port", type=int, default=service_config.port)
+    parser.add_argument("--workers", type=int, default=service_config.workers)
+    parser.add_argument("--queue-size", type=int, default=service_config.queue_size)
+    parser.add_argument("--timeout", type=float, default=service_config.request_timeout_seconds)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    config = QueryServiceConfig(host=args.host, port=args.port, workers=args.workers,
+                                queue_size=args.queue_size, request_timeout_seconds=args.timeout)
+    service = build_service(config)
+
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Query service stopped")
+    finally:
+        service.executor.shutdown(wait=False)
+        service.sessions.close()
+
+if __name__ == "__main__":
+    main()
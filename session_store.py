@@ -0,0 +1,158 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from conversation_manager import ConversationManager
+from config import SessionConfig, session_config
+
+class SessionStore:
+    def __init__(self, config: Optional[SessionConfig] = None):
+        self.config = config or session_config
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = None
+        # Sessions evicted while a request still holds them; re-spilled on release.
+        self._pins: Dict[str, int] = {}
+        self._detached: Dict[str, ConversationManager] = {}
+        self._last_purge = time.time()
+        self.stats = {'hits': 0, 'created': 0, 'restored': 0, 'evicted': 0, 'expired': 0, 'spilled': 0, 'purged': 0}
+
+        if self.config.spill_path:
+            self._db = sqlite3.connect(self.config.spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, payload BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, session_id: str) -> ConversationManager:
+        now = time.time()
+        with self._lock:
+            self._expire_idle(now)
+
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry[1] = now
+                self._sessions.move_to_end(session_id)
+                self.stats['hits'] += 1
+                return entry[0]
+
+            conv_mgr = self._detached.pop(session_id, None) or self._restore(session_id)
+            if conv_mgr is None:
+                conv_mgr = ConversationManager()
+                self.stats['created'] += 1
+            else:
+                self.stats['restored'] += 1
+
+            self._sessions[session_id] = [conv_mgr, now]
+            while len(self._sessions) > self.config.max_sessions:
+                oldest_id, (oldest, _) = self._sessions.popitem(last=False)
+                self._evict(oldest_id, oldest)
+                self.stats['evicted'] += 1
+            return conv_mgr
+
+    @contextmanager
+    def checkout(self, session_id: str) -> Iterator[ConversationManager]:
+        with self._lock:
+            conv_mgr = self.get(session_id)
+            self._pins[session_id] = self._pins.get(session_id, 0) + 1
+        try:
+            yield conv_mgr
+        finally:
+            with self._lock:
+                self._pins[session_id] -= 1
+                if not self._pins[session_id]:
+                    del self._pins[session_id]
+                    detached = self._detached.pop(session_id, None)
+                    if detached is not None:
+                        self._spill(session_id, detached)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._detached.pop(session_id, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+                self._db.commit()
+
+    def _expire_idle(self, now: float):
+        # Sessions are kept in access order, so idle ones are always at the front.
+        cutoff = now - self.config.idle_ttl_seconds
+        while self._sessions:
+            session_id, (conv_mgr, last_access) = next(iter(self._sessions.items()))
+            if last_access >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self._evict(session_id, conv_mgr)
+            self.stats['expired'] += 1
+
+        if self._db is not None and now - self._last_purge >= self.config.idle_ttl_seconds:
+            self._last_purge = now
+            self.stats['purged'] += self._purge(self.config.spill_ttl_seconds)
+
+    def _evict(self, session_id: str, conv_mgr: ConversationManager):
+        self._spill(session_id, conv_mgr)
+        if session_id in self._pins:
+            self._detached[session_id] = conv_mgr
+
+    def _spill(self, session_id: str, conv_mgr: ConversationManager):
+        if self._db is None or not conv_mgr.history:
+            return
+        payload = zlib.compress(json.dumps(conv_mgr.to_dict(), separators=(',', ':')).encode())
+        self._db.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, payload, updated_at) VALUES (?, ?, ?)",
+            (session_id, payload, time.time())
+        )
+        self._db.commit()
+        self.stats['spilled'] += 1
+
+    def _restore(self, session_id: str) -> Optional[ConversationManager]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT payload, updated_at FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+        if row is None:
+            return None
+        self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        if row[1] < time.time() - self.config.spill_ttl_seconds:
+            self.stats['purged'] += 1
+            return None
+        return ConversationManager.from_dict(json.loads(zlib.decompress(row[0])))
+
+    def purge_spilled(self, older_than_seconds: float) -> int:
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._purge(older_than_seconds)
+
+    def _purge(self, older_than_seconds: float) -> int:
+        cursor = self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - older_than_seconds,))
+        self._db.commit()
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._expire_idle(time.time())
+            stats = dict(self.stats, active=len(self._sessions))
+            if self._db is not None:
+                stats['spilled_on_disk'] = self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            return stats
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                for session_id, (conv_mgr, _) in self._sessions.items():
+                    self._spill(session_id, conv_mgr)
+                for session_id, conv_mgr in self._detached.items():
+                    self._spill(session_id, conv_mgr)
+                self._db.close()
+                self._db = None
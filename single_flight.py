@@ -0,0 +1,76 @@
+import hashlib
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.metrics = {'calls': 0, 'executions': 0, 'coalesced': 0, 'errors': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        with self._lock:
+            self.metrics['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.metrics['coalesced'] += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.metrics['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self.metrics['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result, call.waiters > 0
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['in_flight'] = len(self._calls)
+        metrics['coalesced_ratio'] = round(metrics['coalesced'] / metrics['calls'], 3) if metrics['calls'] else 0.0
+        return metrics
+
+def flight_key(*parts: str) -> str:
+    normalized = "\x1f".join(" ".join(part.split()) for part in parts)
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+_flights: Dict[str, SingleFlight] = {}
+_flights_lock = threading.Lock()
+
+def get_flight(name: str) -> SingleFlight:
+    with _flights_lock:
+        if name not in _flights:
+            _flights[name] = SingleFlight(name)
+        return _flights[name]
+
+def coalescing_metrics() -> Dict[str, Dict]:
+    with _flights_lock:
+        flights = list(_flights.values())
+    return {flight.name: flight.get_metrics() for flight in flights}
@@ -1,7 +1,49 @@
-from powerbi_connector import PowerBIConnector
-from decision_engine import DecisionEngine
+from powerbi_connector import PowerBIConnector, fingerprint_version
+from decision_engine import DecisionEngine, non_dominated_ranks
 from llm_client import LLMClient
+from local_standin import StandInServer, fingerprint_row, synthesize_rows
+from query_service import QueryService
+from query_pipeline import QueryPipeline, STAGES
+from load_driver import LoadDriver
+from conversation_manager import ConversationManager
+from evaluation_system import EvaluationSystem
+from session_store import SessionStore
+from forecasting import period_index, seasonal_forecast
+from anomaly_detector import AnomalyDetector, P2Quantile
+from berth_index import BerthIndex, INDEX_COLUMNS, add_berth_congestion
+from vessel_index import VesselIndex
+from memory_monitor import MemoryMonitor
+from single_flight import get_flight
+from config import (PowerBIConfig, AzureGPTConfig, StandInConfig, QueryServiceConfig, SessionConfig,
+                    AnomalyConfig, MemoryConfig)
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+import os
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+import requests
 import pandas as pd
+import numpy as np
+
+@contextmanager
+def standin_pipeline(gpt_config: Optional[AzureGPTConfig] = None, **settings):
+    # A stand-in on a fresh cassette directory and a pipeline wired to it.
+    standin_settings = StandInConfig(cassette_dir=tempfile.mkdtemp(), **settings)
+    standin = StandInServer(standin_settings)
+    standin_settings.url = standin.start()
+    try:
+        pbi_config, gpt_config = PowerBIConfig(), gpt_config or AzureGPTConfig()
+        standin_settings.apply(pbi_config, gpt_config)
+        pipeline = QueryPipeline(PowerBIConnector(pbi_config), DecisionEngine(), ConversationManager(),
+                                 EvaluationSystem(), LLMClient(gpt_config))
+        yield standin_settings, standin, pipeline
+    finally:
+        standin.stop()
 
 def test_powerbi_connection():
     print("Testing Power BI connection...")
@@ -51,6 +93,637 @@ def test_llm_client():
         print(f"Error: {response['content']}")
         return False
 
+def test_standin_replay():
+    print("\nTesting Local Stand-in Replay...")
+    with standin_pipeline(result_rows=120, rate_limit_ratio=0.0) as (settings, server, pipeline):
+        pbi = pipeline.pbi
+        data = pbi.get_operator_data()
+        assert len(data) == 120
+        assert 'ATB (Local Time)' in data.columns
+        assert set(pbi.get_operator_data("GRN")['Operator']) == {"GRN"}
+        print(f"Retrieved {len(data)} synthetic records")
+        
+        analyzed = DecisionEngine().analyze_dataframe(data)
+        assert analyzed['DIS_Score'].between(0, 100).all()
+        
+        # Recorded filtered answers replay as recorded; only the full table is resized.
+        filtered_query = "EVALUATE FILTER('Data', 'Data'[Operator] = \"NVX\")"
+        recorded = [row for row in synthesize_rows(120) if row['data[Operator]'] == 'NVX'][:3]
+        server.cassettes.save("query", filtered_query, {
+            "status": 200, "body": json.dumps({"results": [{"tables": [{"rows": recorded}]}]})
+        })
+        assert len(pbi.get_operator_data("NVX")) == 3
+        
+        query_url = f"{pbi.base_url}/groups/{pbi.config.workspace_id}/datasets/{pbi._get_dataset_id()}/executeQueries"
+        assert requests.post(query_url, data=b"{not json", headers=pbi._get_headers()).status_code == 400
+        
+        os.environ["PRAXIS_STANDIN_URL"] = "http://127.0.0.1:1"
+        try:
+            assert StandInConfig().url == "http://127.0.0.1:1"
+        finally:
+            del os.environ["PRAXIS_STANDIN_URL"]
+        
+        # With a recorded table, fingerprints and pages are derived from it, not synthesized.
+        server.cassettes.save("query", "EVALUATE 'Data'", {
+            "status": 200, "body": json.dumps({"results": [{"tables": [{"rows": synthesize_rows(7, seed=9)}]}]})
+        })
+        table = pbi.get_operator_data()
+        fingerprint = pbi.get_fingerprint()
+        assert len(table) == fingerprint['Rows'] == 120
+        assert fingerprint['BunkerSaved'] == round(float(table['Bunker Saved (USD)'].sum()), 4)
+        assert fingerprint['Operators'] == ",".join(f"{op}:{n}" for op, n in sorted(table['Operator'].value_counts().items()))
+        pages = pd.concat(pbi.iter_data_pages(120, 50), ignore_index=True)
+        assert pages.equals(table)
+        
+        response = pipeline.llm.generate_response("Summarise wait times")
+        assert response['success'] and response['tokens_used'] > 0
+        print(f"Stand-in requests served: {server.stats['requests']}")
+        return True
+
+def test_query_service():
+    print("\nTesting Query Service...")
+    with standin_pipeline(result_rows=150) as (settings, standin, pipeline):
+        service = QueryService(pipeline, QueryServiceConfig(workers=2, queue_size=2, data_refresh_seconds=0))
+        url = service.start_in_thread(port=0)
+        
+        try:
+            assert requests.get(f"{url}/health").json()['status'] == 'ok'
+            
+            answer = requests.post(f"{url}/ask", json={"question": "Show top 5 vessels", "session_id": "a"}).json()
+            assert answer['llm_success'] and 'Recommendations' in answer['content']
+            pipeline.warmup.join()
+            
+            hits = pipeline.answer_cache.get_stats()['hits']
+            top = requests.get(f"{url}/top-k", params={"k": 3, "strategy": "carbon_reduction"}).json()
+            assert len(top['top_k']) == 3
+            
+            compare = requests.post(f"{url}/compare", json={"operators": ["GRN", "NVX"]}).json()
+            assert set(compare['comparison']) == {"GRN", "NVX"}
+            
+            recommendations = requests.get(f"{url}/recommendations", params={"operator": "grn"}).json()
+            assert recommendations['recommendations']
+            assert pipeline.answer_cache.get_stats()['hits'] == hits + 3
+            
+            # The service re-checks the fingerprint and picks up a changed dataset.
+            version = requests.get(f"{url}/health").json()['dataset_version']
+            settings.result_rows = 160
+            requests.get(f"{url}/top-k", params={"k": 1})
+            health = requests.get(f"{url}/health").json()
+            assert health['records'] == 160 and health['dataset_version'] != version
+            
+            assert requests.get(f"{url}/top-k", params={"strategy": "fastest"}).status_code == 400
+            # Bodies that parse but have the wrong shape are client errors, not 500s.
+            for bad in ([], "x", {"operators": "GRN"}, {"operators": ["GRN", 7]}):
+                assert requests.post(f"{url}/compare", json=bad).status_code == 400, bad
+            assert requests.post(f"{url}/ask", json={"question": ["x"]}).status_code == 400
+            assert requests.get(f"{url}/health").json()['status'] == 'ok'
+
+            with requests.post(f"{url}/ask", json={"question": "Compare GRN vs NVX", "stream": True}, stream=True) as r:
+                events = [line[len("data: "):] for line in r.iter_lines(decode_unicode=True) if line]
+            assert events[-1] == "[DONE]"
+            assert json.loads(events[-2])['type'] == 'result'
+            print(f"Streamed {len(events) - 2} chunks, sessions: {len(service.sessions)}")
+            return True
+        finally:
+            service.stop()
+
+def test_single_flight_coalescing():
+    print("\nTesting Single-flight Coalescing...")
+    with standin_pipeline(result_rows=80, latency_ms=300) as (settings, standin, pipeline):
+        pbi = pipeline.pbi
+        pbi.authenticate()
+        pbi.get_dataset_version()
+        queries = standin.stats['requests']['query']
+        
+        before = get_flight("powerbi").get_metrics()
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            frames = list(pool.map(lambda _: pbi.get_operator_data(), range(5)))
+        after = get_flight("powerbi").get_metrics()
+        
+        executions = after['executions'] - before['executions']
+        coalesced = after['coalesced'] - before['coalesced']
+        assert executions == 1 and coalesced == 4
+        assert standin.stats['requests']['query'] == queries + 1
+        assert all(len(df) == 80 for df in frames)
+        assert len({id(df) for df in frames}) == 5
+        print(f"5 concurrent fetches -> {executions} request, {coalesced} coalesced")
+        return True
+
+def test_warmup_cache():
+    print("\nTesting Answer Warm-up...")
+    with standin_pipeline(result_rows=200) as (settings, standin, pipeline):
+        # Hold the warm-up at its first step to show fetches and chats do not wait for it.
+        release, get_forecasts = threading.Event(), pipeline.forecaster.get_forecasts
+        pipeline.forecaster.get_forecasts = lambda *args: release.wait() and get_forecasts(*args)
+        df = pipeline.fetch_data()
+        version = df.attrs['dataset_version']
+        cache = pipeline.answer_cache
+        assert not cache.is_current(version)
+        hits = cache.get_stats()['hits']
+        result = pipeline.handle_message("Show top 5 vessels by efficiency", df)
+        assert result['llm_success'] and cache.get_stats()['hits'] == hits
+        
+        release.set()
+        pipeline.warmup.join()
+        assert cache.is_current(version)
+        
+        for strategy in ["balanced", "reliability"]:
+            engine = DecisionEngine(strategy)
+            live = engine.compare_operators(df.copy(), ["GRN", "NVX"])
+            cached = cache.comparison(version, strategy, ["GRN", "NVX"])
+            for op in live:
+                for metric, value in live[op].items():
+                    assert abs(cached[op][metric] - value) <= 0.011
+            live_top = engine.get_top_performers(df.copy())
+            assert cache.top_performers(version, strategy, 5).equals(live_top)
+            assert cache.recommendations(version, strategy) == engine.generate_recommendations(df.copy())
+        
+        hits = cache.get_stats()['hits']
+        pipeline.handle_message("Show top 5 vessels by efficiency", df)
+        assert cache.get_stats()['hits'] == hits + 2
+        
+        # A session's own strategy engine answers without re-weighting the shared one.
+        hits = cache.get_stats()['hits']
+        result = pipeline.handle_message("Show top 5 vessels by efficiency", df, engine=DecisionEngine("reliability"))
+        assert result['llm_success'] and cache.get_stats()['hits'] == hits + 2
+        assert pipeline.engine.strategy == 'balanced'
+        
+        assert pipeline.fetch_data().attrs['dataset_version'] == version
+        assert cache.get_stats()['warmups'] == 1
+        print(f"Warm-up took {cache.get_stats()['last_warmup_seconds']}s for {len(df)} records")
+        return True
+
+def test_session_store():
+    print("\nTesting Session Store...")
+    spill_path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(SessionConfig(max_sessions=3, idle_ttl_seconds=3600, spill_path=spill_path))
+    
+    for i in range(5):
+        conv = store.get(f"user-{i}")
+        for turn in range(15):
+            conv.add_message("user", f"Compare GRN and NVX turn {turn} from user {i}")
+        assert len(conv.history) == conv.max_history
+    
+    stats = store.get_stats()
+    assert stats['active'] == 3 and stats['evicted'] == 2 and stats['spilled_on_disk'] == 2
+    
+    restored = store.get("user-0")
+    assert store.get_stats()['restored'] == 1
+    assert list(restored.history)[-1]['content'].endswith("user 0")
+    assert restored.context['operators_mentioned'] == {"GRN", "NVX"}
+    assert store.get("user-4") is store.get("user-4")
+    
+    # A session evicted mid-request keeps the turns added after the spill.
+    with store.checkout("user-5") as held:
+        held.add_message("user", "first turn")
+        for i in range(6, 9):
+            store.get(f"user-{i}")
+        held.add_message("user", "turn after eviction")
+    assert [m['content'] for m in store.get("user-5").history] == ["first turn", "turn after eviction"]
+    
+    store.config.spill_ttl_seconds = 0
+    assert len(store.get("user-0").history) == 0 and store.get_stats()['purged'] >= 1
+    assert store.purge_spilled(0) >= 1
+    
+    store.config.idle_ttl_seconds = 0
+    assert store.get_stats()['active'] == 0
+    store.close()
+    print(f"Session store stats: {stats}")
+    return True
+
+def test_evaluation_aggregation():
+    print("\nTesting Evaluation Aggregation...")
+    eval_sys = EvaluationSystem()
+    
+    def record(worker):
+        for _ in range(1000):
+            eval_sys.end_query(eval_sys.start_query() - 0.5, session_id=f"s{worker % 2}", tokens=10)
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(record, range(8)))
+    
+    summary = eval_sys.get_performance_summary()
+    assert summary['total_queries'] == 8000
+    assert summary['total_tokens'] == 80000
+    assert abs(summary['avg_response_time'] - 0.5) < 0.01
+    assert eval_sys.get_performance_summary("s0")['total_queries'] == 4000
+    assert eval_sys.metrics['query_count'] == 8000
+    # Eight writer threads must spread over several shards rather than all landing in one.
+    assert sum(1 for shard in eval_sys.global_view.response_times._shards if shard.count) > 1
+    
+    metrics = eval_sys.get_real_time_metrics()
+    assert metrics['queries_this_session'] == 8000
+    assert metrics['queries_per_min'] == 8000 and metrics['tokens_per_min'] == 80000
+    assert eval_sys.get_real_time_metrics("unknown")['queries_this_session'] == 0
+    assert eval_sys.get_performance_summary("unknown") == {'status': 'No data yet'}
+    assert "unknown" not in eval_sys.session_views
+    print(f"Aggregated summary: {summary}")
+    return True
+
+def test_forecasting():
+    print("\nTesting Forecasting...")
+    with standin_pipeline(result_rows=400) as (settings, standin, pipeline):
+        df = pipeline.fetch_data()
+        pipeline.warmup.join()
+        forecaster = pipeline.forecaster
+        assert forecaster.stats['fits'] == 1
+        
+        latest = df[(df['Year'] * 12 + df['Month']) == (df['Year'] * 12 + df['Month']).max()]
+        for op in ["GRN", "NVX"]:
+            forecast = forecaster.forecast(df, "Operator", op)
+            expected = df[df['Operator'] == op]
+            assert forecast['observations'] == len(expected)
+            assert len(forecast['forecast']) == forecaster.horizon
+            latest_op = latest[latest['Operator'] == op]
+            if len(latest_op):
+                assert abs(forecast['last_value'] - latest_op['Wait Time (Hours): ATB-BTR'].mean()) < 0.01
+        
+        accuracy = forecaster.forecast(df, "ALL", "ALL", "arrival_accuracy")
+        assert all(0 <= value <= 100 for value in accuracy['forecast'])
+        
+        conv_mgr = ConversationManager()
+        question = "Predict wait time for GRN next month"
+        summary = pipeline.build_data_summary(conv_mgr.infer_intent(question), df, question)
+        assert "Operator GRN" in summary
+        assert forecaster.stats['fits'] == 1 and forecaster.stats['hits'] >= 3
+        
+        # A corrupt Year is dropped instead of widening the period axis to ~100k months.
+        corrupt = df.head(5).copy()
+        corrupt.loc[corrupt.index[0], 'Year'] = 99999
+        periods = period_index(corrupt)
+        assert np.isnan(periods[0]) and not np.isnan(periods[1:]).any()
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            sparse = seasonal_forecast(np.array([[np.nan, np.nan], [1.0, np.nan]]), 0, 2)
+        assert np.isnan(sparse[0]).all() and (sparse[1] == 1.0).all()
+        print(summary)
+        return True
+
+def test_anomaly_detector():
+    print("\nTesting Anomaly Detector...")
+    sketch = P2Quantile(0.95)
+    for i in range(1000):
+        sketch.add(float(i % 100))
+    assert abs(sketch.value() - 95) < 3
+    
+    detector = AnomalyDetector(AnomalyConfig(min_samples=20))
+    base = {'Operator': 'GRN', 'BU': 'BUSAN', 'Service': '1A0', 'Vessel': 'MV TEST',
+            'Berth Time (hours): ATU - ATB': 30.0, 'Bunker Saved (USD)': 30000.0, 'Carbon Abatement (Tonnes)': 0.5}
+    for i in range(200):
+        call = dict(base, **{'Rotation No.': f"R{i}", 'Wait Time (Hours): ATB-BTR': 2.0})
+        assert detector.observe(call) == []
+    
+    flagged = detector.observe(dict(base, **{'Rotation No.': "LATE", 'Wait Time (Hours): ATB-BTR': -15.0,
+                                             'Carbon Abatement (Tonnes)': 0.01}))
+    assert {a['metric'] for a in flagged} == {'wait_time', 'carbon_abatement'}
+    assert detector.top_anomalies(1)[0]['rotation'] == "LATE"
+    
+    df = pd.DataFrame([dict(base, **{'Rotation No.': f"D{i}", 'ATB (Local Time)': f"2024-01-{i % 28 + 1:02d}T00:00:00",
+                                     'Wait Time (Hours): ATB-BTR': 2.0}) for i in range(50)])
+    df.attrs['dataset_version'] = "v1"
+    assert detector.sync(df) == 50
+    assert detector.sync(df) == 0
+    df.attrs['dataset_version'] = "v2"
+    assert detector.sync(df) == 0
+    # Keys of calls that left the dataset are pruned when the version changes.
+    subset = df.head(10).copy()
+    subset.attrs['dataset_version'] = "v3"
+    assert detector.sync(subset) == 0 and len(detector._seen) == 10
+    
+    recommendation = DecisionEngine().outlier_recommendation(detector.top_anomalies(3, ["GRN"]))
+    assert "MV TEST" in recommendation
+    print(recommendation)
+    return True
+
+def test_berth_index():
+    print("\nTesting Berth Index...")
+    calls = [
+        ("BUSAN", "2024-01-01 00:00", "2024-01-01 02:00", "2024-01-01 10:00"),
+        ("BUSAN", "2024-01-01 04:00", "2024-01-01 05:00", "2024-01-01 12:00"),
+        ("BUSAN", "2024-01-01 06:00", "2024-01-01 06:00", "2024-01-01 08:00"),
+        ("BUSAN", "2024-01-01 20:00", "2024-01-01 20:00", "2024-01-01 22:00"),
+        ("JAKARTA", "2024-01-01 00:00", "2024-01-01 01:00", "2024-01-01 03:00")
+    ]
+    df = pd.DataFrame(calls, columns=['BU', 'Final BTR (Local Time)', 'ATB (Local Time)', 'ATU (Local Time)'])
+    index = BerthIndex(df, version="v1")
+    
+    assert index.vessels_at("BUSAN", "2024-01-01 07:00") == {'alongside': 3, 'waiting': 0}
+    assert index.vessels_at("BUSAN", "2024-01-01 04:30") == {'alongside': 1, 'waiting': 1}
+    assert index.vessels_at("BUSAN", "2024-01-01 10:00")['alongside'] == 1
+    assert index.overlapping_calls("BUSAN", "2024-01-01 09:00", "2024-01-01 21:00") == [0, 1, 3]
+    assert index.count_overlapping("BUSAN", "2024-01-01 09:00", "2024-01-01 21:00") == 3
+    
+    peak = index.peak_windows("BUSAN", 1)[0]
+    assert peak['vessels'] == 3 and peak['start'] == pd.Timestamp("2024-01-01 06:00")
+    assert list(index.congestion_at_arrival(df)) == [round(1 / 3, 3), round(2 / 3, 3), 1.0, round(1 / 3, 3), 1.0]
+    
+    engine = DecisionEngine()
+    row = pd.Series({'Berth Time (hours): ATU - ATB': 8, 'Wait Time (Hours): ATB-BTR': 1,
+                     'Arrival Accuracy (Final BTR)': 'Y'})
+    assert engine.calculate_risk_level(row) == 100
+    assert engine.calculate_risk_level(pd.concat([row, pd.Series({'Berth_Congestion': 0.9})])) == 90
+    print(index.summary())
+    return True
+
+def test_vessel_index():
+    print("\nTesting Vessel Index...")
+    df = pd.DataFrame({
+        'Vessel': ['MV GOLDEN FALCON', 'MV GOLDEN FALCON', 'MV OCEAN CORAL', 'M/V Pacific Wave'],
+        'IMO': ['9100137', '9100137', '9100274', 9100411.0],
+        'Rotation No.': ['BUS24000001', 'BUS24000002', 'SIN24000003', 'JAK24000004'],
+        'ATB (Local Time)': ['2024-03-01T00:00:00', '2024-01-01T00:00:00', '2024-02-01T00:00:00', '2024-02-02T00:00:00'],
+        'Operator': ['GRN', 'GRN', 'NVX', 'SVQ'],
+        'BU': ['BUSAN', 'BUSAN', 'SINGAPORE', 'JAKARTA'],
+        'Wait Time (Hours): ATB-BTR': [2.0, 12.0, 1.0, 3.0],
+        'Arrival Accuracy (Final BTR)': ['Y', 'N', 'Y', 'Y'],
+        'Berth Time (hours): ATU - ATB': [20.0, 55.0, 10.0, 12.0],
+        'Bunker Saved (USD)': [35000.0, 7000.0, 14000.0, 0.0],
+        'Carbon Abatement (Tonnes)': [0.5, 0.1, 0.2, 0.0]
+    })
+    index = VesselIndex(df, version="v1")
+    
+    assert index.lookup("9100137") == [1, 0]
+    assert index.latest("golden falcon") == 0
+    assert index.lookup("GOLDEN FAL") == [1, 0]
+    assert index.lookup("OCEAN CORRAL") == [2]
+    assert index.lookup("bus24000002") == [1]
+    assert index.lookup("9100411") == [3]
+    assert index.lookup("") == index.lookup("   ") == index.lookup("MV ") == []
+    assert index.latest(" ") is None
+    assert index.find_in_text("Explain the DIS score of Golden Falcon vs IMO 9100274") == ["9100274", "MV GOLDEN FALCON"]
+    assert index.find_in_text("Show top 5 vessels by efficiency") == []
+    
+    engine = DecisionEngine()
+    breakdown = engine.explain_dis(df.iloc[0])
+    assert breakdown['dis'] == engine.calculate_dis(df.iloc[0])
+    assert abs(sum(breakdown['contributions'].values()) - breakdown['dis']) < 0.05
+    
+    pipeline = QueryPipeline(None, engine, ConversationManager(), EvaluationSystem(), None)
+    conv_mgr = ConversationManager()
+    stage_times = {}
+    intent, _, prompt = pipeline._prepare("Why is golden falcon's DIS score low?", df, conv_mgr, stage_times, pipeline.engine)
+    assert intent['entities']['vessels'] == ["MV GOLDEN FALCON"]
+    assert conv_mgr.context['vessels_mentioned'] == {"MV GOLDEN FALCON"}
+    assert "BUS24000001" in prompt and f"DIS {breakdown['dis']}" in prompt
+    print(pipeline.vessel_drilldown(["golden falcon"], df))
+    return True
+
+def test_pareto_fronts():
+    print("\nTesting Pareto Fronts...")
+    rng = np.random.default_rng(7)
+    points = rng.integers(0, 6, (150, 4)).astype(float)
+    
+    remaining, expected, rank = set(range(len(points))), np.zeros(len(points), dtype=int), 1
+    while remaining:
+        front = [i for i in remaining if not any(
+            (points[j] >= points[i]).all() and (points[j] > points[i]).any() for j in remaining)]
+        expected[front] = rank
+        remaining -= set(front)
+        rank += 1
+    assert (non_dominated_ranks(points) == expected).all()
+    
+    with standin_pipeline(result_rows=200) as (settings, standin, pipeline):
+        df = pipeline.fetch_data()
+        pipeline.warmup.join()
+        engine = DecisionEngine()
+        analyzed = engine.analyze_dataframe(df.copy())
+        
+        by_bu = engine.pareto_fronts(analyzed, 'BU')
+        for bu, frame in analyzed.groupby('BU'):
+            assert (by_bu[frame.index] == engine.pareto_fronts(frame)).all()
+        
+        live_front = engine.pareto_front(analyzed, 10)
+        cached_front, skyline = pipeline.answer_cache.pareto(df.attrs['dataset_version'], "balanced", 10)
+        assert cached_front.equals(live_front)
+        assert skyline['Pareto_Rank'].min() == 1
+        
+        intent = ConversationManager().infer_intent("Which vessels are not dominated on all trade-offs?")
+        assert intent['type'] == 'ranking' and intent['entities']['pareto']
+        summary = pipeline.build_data_summary(intent, df)
+        assert "Pareto Front" in summary and "Operator Skyline" in summary
+        
+        # Per-BU fronts come from the warm-up too, and the ranking intent picks them by name.
+        bu, frame = next(iter(analyzed.groupby('BU')))
+        cached_bu, _ = pipeline.answer_cache.pareto(df.attrs['dataset_version'], "balanced", 10, bu=bu)
+        assert cached_bu.equals(engine.pareto_front(frame, 10))
+        question = f"Which {bu} calls are not dominated on the trade-offs?"
+        bu_summary = pipeline.build_data_summary(ConversationManager().infer_intent(question), df, question)
+        assert f"Pareto Front for {bu}" in bu_summary
+        
+        # Before the warm-up has sorted a dataset's fronts, the answer is the plain DIS ranking.
+        pending = df.copy(deep=False)
+        pending.attrs['dataset_version'] = "pending"
+        assert "Pareto Front" not in pipeline.build_data_summary(intent, pending)
+        print(summary)
+        return True
+
+def test_memory_budget():
+    print("\nTesting Memory Budget...")
+    with standin_pipeline(result_rows=120) as (settings, standin, pipeline):
+        first, second = pipeline.fetch_data(), pipeline.fetch_data()
+        assert np.shares_memory(first['Bunker Saved (USD)'].to_numpy(), second['Bunker Saved (USD)'].to_numpy())
+        first['DIS_Score'] = 0.0
+        assert 'DIS_Score' not in second.columns
+        
+        monitor = MemoryMonitor(MemoryConfig(profile=True, budget_mb=1, chunk_rows=50, snapshot_top=3))
+        engine = DecisionEngine()
+        full = engine.analyze_dataframe(second.copy())
+        assert 'DIS_Score' not in second.columns
+        
+        # Sized from the fingerprint, then fetched and scored a page at a time
+        version, fingerprint = pipeline.pbi.fingerprint_if_changed()
+        assert fingerprint['Rows'] == 120 and monitor.rows_over_budget(fingerprint['Rows'])
+        assert not MemoryMonitor(MemoryConfig(budget_mb=0)).rows_over_budget(fingerprint['Rows'])
+        index = BerthIndex(pipeline.pbi.get_columns(INDEX_COLUMNS), version)
+        pages = list(pipeline.pbi.iter_data_pages(fingerprint['Rows'], 50, version))
+        assert [len(page) for page in pages] == [50, 50, 20]
+        for page in pages:
+            add_berth_congestion(page, index)
+        with monitor:
+            with monitor.stage('analysis'):
+                paged = engine.analyze_pages(pages, ['Vessel', 'Berth_Congestion', 'DIS_Score', 'Missing'])
+        assert not tracemalloc.is_tracing()
+        assert list(paged.columns) == ['Vessel', 'Berth_Congestion', 'DIS_Score']
+        assert paged['Berth_Congestion'].equals(second['Berth_Congestion'])
+        assert paged['DIS_Score'].equals(full['DIS_Score'])
+        
+        stats = monitor.stages['analysis']
+        assert stats['traced_peak_mb'] >= 0 and len(stats['top_allocations']) <= 3
+        assert "memory: RSS" in monitor.describe('analysis')
+        print(f"Paged analysis{monitor.describe('analysis')}")
+        return True
+
+def test_llm_hedging():
+    print("\nTesting LLM Hedging...")
+    gpt_config = AzureGPTConfig(deadline_seconds=0.25, hedge_delay_seconds=0.05, fallback_margin_seconds=0.1)
+    with standin_pipeline(gpt_config, result_rows=120, latency_ms=300) as (settings, standin, pipeline):
+        df = pipeline.fetch_data()
+        
+        result = pipeline.handle_message("Recommend improvements for GRN wait times", df)
+        stats = pipeline.llm.get_stats()
+        assert result['llm_fallback'] and not result['llm_success']
+        assert "average DIS" in result['answer'] and "GRN" in result['answer']
+        # The fallback covers every GRN call, not only the rows sampled for the prompt.
+        assert f"{(df['Operator'] == 'GRN').sum()} vessel calls" in result['answer']
+        assert result['stage_times']['llm'] < gpt_config.deadline_seconds
+        assert stats['hedged'] == 1 and stats['deadline_exceeded'] == 1 and stats['fallback_rate'] == 1.0
+        
+        # A streamed answer misses the same deadline and falls back the same way
+        events = list(pipeline.stream_message("How is GRN doing on wait times?", df))
+        assert events[-1]['type'] == 'result' and events[-1]['llm_fallback'] and not events[-1]['llm_success']
+        
+        llm = LLMClient(AzureGPTConfig(**{**gpt_config.__dict__, 'deadline_seconds': 5.0, 'hedge_min_samples': 1}))
+        response = llm.generate_response("Summarize berth utilisation", fallback=lambda: "fallback")
+        assert response['success'] and not response.get('fallback')
+        # The hedge delay tracks single attempts, which take about the stand-in latency.
+        stats = llm.get_stats()
+        assert stats['fallbacks'] == 0 and 0.3 <= stats['hedge_delay_seconds'] < 1.0
+        
+        # Fast failures are retried after a backoff, not hedged
+        settings.latency_ms, settings.rate_limit_ratio = 0, 1.0
+        llm = LLMClient(AzureGPTConfig(**{**gpt_config.__dict__, 'deadline_seconds': 5.0}))
+        response = llm.generate_response("Summarize berth utilisation", fallback=lambda: "fallback")
+        stats = llm.get_stats()
+        assert response['fallback'] and not response['success'] and response['content'] == "fallback"
+        assert stats['hedged'] == 0 and stats['retries'] == 1 and stats['attempts'] == 2
+        assert stats['retry_after_waits'] == 2
+        
+        # A Retry-After beyond the deadline falls back at once instead of waiting it out
+        settings.retry_after_seconds = 10
+        llm = LLMClient(AzureGPTConfig(**{**gpt_config.__dict__, 'deadline_seconds': 5.0}))
+        started = time.perf_counter()
+        response = llm.generate_response("Summarize berth utilisation", fallback=lambda: "fallback")
+        stats = llm.get_stats()
+        assert response['fallback'] and time.perf_counter() - started < 1.0
+        assert stats['attempts'] == 1 and stats['retries'] == 0 and stats['deadline_exceeded'] == 0
+        print(f"Fallback answer: {result['answer']}")
+        print(f"Hedge stats: {stats}")
+        return True
+
+def test_batched_generation():
+    print("\nTesting Batched Generation...")
+    with standin_pipeline(result_rows=120, json_omit_every=3) as (settings, standin, pipeline):
+        engine = DecisionEngine()
+        analyzed = engine.analyze_dataframe(pipeline.pbi.get_operator_data())
+        entities = engine.entity_stats(analyzed, 'Operator')
+        assert len(entities) == 10 and sum(stats['calls'] for stats in entities.values()) == 120
+        
+        llm = pipeline.llm
+        batch = llm.generate_batch(entities, "Write a narrative for each operator.")
+        assert batch['success'] and set(batch['narratives']) == set(entities)
+        assert all(key in text for key, text in batch['narratives'].items())
+        # 10 entities, every 3rd dropped: 3 re-requested, then 1, then none.
+        assert batch['requests'] == 3
+        stats = llm.get_stats()
+        assert stats['batch_retried_entities'] == 4 and stats['entities_per_batch'] == round(10 / 3, 2)
+        
+        settings.json_omit_every = 0
+        llm = LLMClient(AzureGPTConfig(**{**pipeline.llm.config.__dict__, 'batch_size': 4, 'batch_retries': 0}))
+        batch = llm.generate_batch(entities, "Write a narrative for each operator.")
+        assert batch['success'] and batch['requests'] == 3
+        
+        # A batch whose request fails is split and each half re-requested
+        instruction, first_four = "Write a narrative for each operator.", dict(list(entities.items())[:4])
+        standin.cassettes.save("chat", json.dumps({
+            'messages': [{"role": "user", "content": llm._batch_prompt(instruction, first_four)}],
+            'stream': False, 'response_format': {"type": "json_object"}
+        }, sort_keys=True), {"status": 503, "body": json.dumps({"error": {"message": "Overloaded"}})})
+        split = llm.generate_batch(first_four, instruction)
+        assert split['success'] and set(split['narratives']) == set(first_four)
+        assert split['requests'] == 3 and llm.get_stats()['batch_splits'] == 1
+        print(f"Narrative sample: {next(iter(batch['narratives'].values()))}")
+        return True
+
+def test_dataset_fingerprint():
+    print("\nTesting Dataset Fingerprint...")
+    with standin_pipeline(result_rows=120) as (settings, standin, pipeline):
+        pbi = pipeline.pbi
+        
+        fingerprint = pbi.get_fingerprint()
+        assert fingerprint['Rows'] == 120 and set(fingerprint) == {
+            'Rows', 'MaxATU', 'MaxYear', 'MaxMonth', 'BunkerSaved', 'CarbonAbatement', 'WaitTime', 'BerthTime',
+            'AccurateArrivals', 'OnTimeArrivals', 'Operators'
+        }
+        
+        # A correction to any DIS input moves the version.
+        rows = synthesize_rows(120)
+        for column, value in [('Carbon Abatement (Tonnes)', 0.91), ('Arrival Accuracy (Final BTR)', 'N'),
+                              ('Arrival Variance (within 4h target)', 'N'), ('Operator', 'ZZZ')]:
+            edited = [dict(row) for row in rows]
+            edited[0] = dict(edited[0], **{f"data[{column}]": value})
+            assert fingerprint_version(fingerprint_row(edited)) != fingerprint_version(fingerprint_row(rows)), column
+        
+        first = pipeline.fetch_data()
+        queries = standin.stats['requests']['query']
+        second = pipeline.fetch_data()
+        # An unchanged dataset costs only the one-row fingerprint query.
+        assert standin.stats['requests']['query'] == queries + 1
+        version = first.attrs['dataset_version']
+        assert second.attrs['dataset_version'] == version == pbi.get_dataset_version()
+        assert pbi.refresh_stats['skipped'] == 1 and pbi.refresh_stats['full_fetches'] == 1
+        pipeline.warmup.join()
+        fits = pipeline.forecaster.stats['fits']
+        pipeline.detector_sync.join()
+        assert pipeline.detector.version == version
+        
+        settings.result_rows = 130
+        refreshed = pipeline.fetch_data()
+        assert len(refreshed) == 130 and refreshed.attrs['dataset_version'] != version
+        pipeline.warmup.join()
+        assert pipeline.answer_cache.version == refreshed.attrs['dataset_version']
+        assert pipeline.vessel_index(refreshed).version == refreshed.attrs['dataset_version']
+        assert pipeline.forecaster.stats['fits'] == fits + 1
+        
+        # A refresh landing mid-download is caught by the fingerprint re-check and read again.
+        download = pbi.get_operator_data
+        def refreshed_during_download(operator=None):
+            df = download(operator)
+            settings.result_rows = 140
+            return df
+        pbi.get_operator_data = refreshed_during_download
+        settings.result_rows = 135
+        try:
+            version, raced = pbi.fetch_if_changed(refreshed.attrs['dataset_version'])
+        finally:
+            del pbi.get_operator_data
+        assert len(raced) == 140 and pbi.refresh_stats['raced'] == 1
+        assert version == raced.attrs['dataset_version'] == pbi.get_dataset_version()
+        print(f"Dataset versions: {version} -> {refreshed.attrs['dataset_version']}, refresh stats {pbi.refresh_stats}")
+        return True
+
+def test_load_driver():
+    print("\nTesting Load Driver...")
+    with standin_pipeline(result_rows=120, latency_ms=200) as (settings, standin, pipeline):
+        conv_mgr = ConversationManager()
+        result = pipeline.handle_message("Show top 5 vessels by efficiency", conv_mgr=conv_mgr, session_id="direct")
+        assert result['llm_success'] and set(result['stage_times']) == set(STAGES)
+        assert len(conv_mgr.history) == 2 and 1 <= len(result['recommendations'])
+        requests_before = dict(standin.stats['requests'])
+        flight_before, llm_before = get_flight("powerbi").get_metrics(), get_flight("llm").get_metrics()
+        
+        # Four users start together on an unchanged dataset: their fetches share one
+        # fingerprint request, after which each session reuses its cached frame.
+        driver = LoadDriver(pipeline, ["Show top 5 vessels by efficiency", "What are the main delay factors?"],
+                            users=4, rate=0, total_messages=12)
+        report = driver.run()
+        flight_after, llm_after = get_flight("powerbi").get_metrics(), get_flight("llm").get_metrics()
+        assert report['messages'] == 12 and report['errors'] == 0 and report['llm_failures'] == 0
+        # Identical first prompts from fresh sessions may share one completion.
+        llm_executions = llm_after['executions'] - llm_before['executions']
+        assert llm_executions + llm_after['coalesced'] - llm_before['coalesced'] == 12
+        assert standin.stats['requests']['chat'] - requests_before['chat'] == llm_executions
+        assert standin.stats['requests']['query'] - requests_before['query'] == 1
+        assert flight_after['coalesced'] - flight_before['coalesced'] == 3
+        assert len(driver.sessions) == 4
+        
+        settings.rate_limit_ratio = 1.0
+        failing = LoadDriver(pipeline, ["Show top 5 vessels by efficiency"], users=2, rate=0, total_messages=4)
+        failed = failing.run()
+        assert failed['messages'] == 4 and failed['errors'] == 4 and failed['errors_sample']
+        print(f"Load run: {report['messages']} messages, p95 {report['end_to_end']['p95_ms']}ms; "
+              f"throttled run: {failed['errors']} errors")
+        return True
+
 def run_all_tests():
     print("=" * 50)
     print("PSA Intelligent Assistant - System Tests")
@@ -59,7 +732,23 @@ def run_all_tests():
     tests = [
         ("Power BI Connection", test_powerbi_connection),
         ("Decision Engine", test_decision_engine),
-        ("LLM Client", test_llm_client)
+        ("LLM Client", test_llm_client),
+        ("Local Stand-in Replay", test_standin_replay),
+        ("Query Service", test_query_service),
+        ("Single-flight Coalescing", test_single_flight_coalescing),
+        ("Answer Warm-up", test_warmup_cache),
+        ("Session Store", test_session_store),
+        ("Evaluation Aggregation", test_evaluation_aggregation),
+        ("Forecasting", test_forecasting),
+        ("Anomaly Detector", test_anomaly_detector),
+        ("Berth Index", test_berth_index),
+        ("Vessel Index", test_vessel_index),
+        ("Pareto Fronts", test_pareto_fronts),
+        ("Memory Budget", test_memory_budget),
+        ("LLM Hedging", test_llm_hedging),
+        ("Batched Generation", test_batched_generation),
+        ("Dataset Fingerprint", test_dataset_fingerprint),
+        ("Load Driver", test_load_driver)
     ]
     
     results = {}
@@ -0,0 +1,116 @@
+import bisect
+import difflib
+import re
+import pandas as pd
+from typing import Dict, List, Optional
+from warmup import content_version
+
+VESSEL_PREFIXES = {'MV', 'M/V', 'MS', 'MT', 'M.V.'}
+IMO_PATTERN = re.compile(r'\b(?:IMO\s*)?(\d{7})\b', re.IGNORECASE)
+
+def normalize_name(name) -> str:
+    tokens = re.sub(r"[^A-Z0-9/ ]", " ", str(name).upper()).split()
+    if tokens and tokens[0] in VESSEL_PREFIXES:
+        tokens = tokens[1:]
+    return " ".join(tokens)
+
+def normalize_imo(imo) -> str:
+    text = str(imo).strip()
+    return text[:-2] if text.endswith('.0') else text
+
+class VesselIndex:
+    def __init__(self, df: pd.DataFrame, version: Optional[str] = None):
+        self.version = version or df.attrs.get('dataset_version') or content_version(df)
+        self.by_imo: Dict[str, List[int]] = {}
+        self.by_name: Dict[str, List[int]] = {}
+        self.by_rotation: Dict[str, int] = {}
+        self.display_names: Dict[str, str] = {}
+
+        if 'ATB (Local Time)' in df.columns:
+            arrival_order = pd.to_datetime(df['ATB (Local Time)'], errors='coerce').argsort(kind='stable')
+        else:
+            arrival_order = range(len(df))
+
+        vessels = df['Vessel'].tolist() if 'Vessel' in df.columns else [None] * len(df)
+        imos = df['IMO'].tolist() if 'IMO' in df.columns else [None] * len(df)
+        rotations = df['Rotation No.'].tolist() if 'Rotation No.' in df.columns else [None] * len(df)
+
+        # Rows are appended in arrival order, so the last position is the latest call.
+        for pos in arrival_order:
+            pos = int(pos)
+            if pd.notna(vessels[pos]):
+                name = normalize_name(vessels[pos])
+                self.by_name.setdefault(name, []).append(pos)
+                self.display_names.setdefault(name, str(vessels[pos]))
+            if pd.notna(imos[pos]):
+                self.by_imo.setdefault(normalize_imo(imos[pos]), []).append(pos)
+            if pd.notna(rotations[pos]):
+                self.by_rotation[str(rotations[pos]).upper()] = pos
+
+        self.sorted_names = sorted(self.by_name)
+
+    def _prefixed(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.sorted_names, prefix)
+        end = bisect.bisect_left(self.sorted_names, prefix + "\uffff")
+        return self.sorted_names[start:end]
+
+    def lookup(self, query: str) -> List[int]:
+        key = str(query).strip()
+        if not key:
+            return []
+        if key.upper() in self.by_rotation:
+            return [self.by_rotation[key.upper()]]
+        if normalize_imo(key) in self.by_imo:
+            return list(self.by_imo[normalize_imo(key)])
+
+        name = normalize_name(key)
+        # An empty name (e.g. a bare "MV") would prefix-match every vessel.
+        if not name:
+            return []
+        if name in self.by_name:
+            return list(self.by_name[name])
+
+        matches = self._prefixed(name) or difflib.get_close_matches(name, self.sorted_names, n=3, cutoff=0.8)
+        return [pos for match in matches for pos in self.by_name[match]]
+
+    def latest(self, query: str) -> Optional[int]:
+        positions = self.lookup(query)
+        return positions[-1] if positions else None
+
+    def find_in_text(self, text: str) -> List[str]:
+        found = []
+        upper = text.upper()
+
+        for imo in IMO_PATTERN.findall(text):
+            if imo in self.by_imo:
+                found.append(imo)
+        for token in re.findall(r"[A-Z0-9]+", upper):
+            if token in self.by_rotation:
+                found.append(token)
+
+        # Longest vessel name starting at each word, extended while some name still has that prefix.
+        tokens = normalize_name(text).split()
+        i = 0
+        while i < len(tokens):
+            match, end = None, i
+            for j in range(i + 1, len(tokens) + 1):
+                phrase = " ".join(tokens[i:j])
+                if not self._prefixed(phrase):
+                    break
+                if phrase in self.by_name:
+                    match, end = phrase, j
+            if match:
+                found.append(self.display_names[match])
+                i = end
+            else:
+                i += 1
+
+        return list(dict.fromkeys(found))
+
+    def get_stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'vessels': len(self.by_name),
+            'imo_numbers': len(self.by_imo),
+            'rotations': len(self.by_rotation)
+        }
@@ -0,0 +1,193 @@
+import hashlib
+import threading
+import time
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+from decision_engine import DecisionEngine, TOP_PERFORMER_COLUMNS
+from config import decision_weights
+
+STRATEGIES = ['balanced', 'carbon_reduction', 'cost_efficiency', 'reliability']
+
+def content_version(df: pd.DataFrame) -> str:
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    digest = hashlib.sha256(row_hashes.values.tobytes())
+    digest.update(",".join(map(str, df.columns)).encode())
+    return digest.hexdigest()[:16]
+
+class AnswerCache:
+    def __init__(self, top_k: int = 20, summary_rows: int = 50):
+        self.top_k = top_k
+        self.summary_rows = summary_rows
+        self.version: Optional[str] = None
+        self.expected: Optional[str] = None
+        self.entries: Dict[str, Dict] = {}
+        self.narratives: Dict[str, Dict] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'narrative_hits': 0, 'warmups': 0,
+                      'narratives': 0, 'last_warmup_seconds': 0.0}
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+
+    def is_current(self, version: Optional[str]) -> bool:
+        return version is not None and version == self.version
+
+    def expect(self, version: str):
+        # Background warm-ups can finish out of order; only the newest version may land.
+        with self._lock:
+            self.expected = version
+
+    def _stale(self, version: str) -> bool:
+        return self.expected is not None and self.expected != version
+
+    def warm(self, df: pd.DataFrame, version: str) -> bool:
+        with self._warm_lock:
+            if self.is_current(version) or self._stale(version):
+                return False
+
+            start = time.perf_counter()
+            engine = DecisionEngine()
+            analyzed = engine.analyze_dataframe(df.copy())
+            operators = sorted(analyzed['Operator'].dropna().unique())
+            # Fronts depend only on the component scores, not on the strategy weights.
+            pareto_ranks = {group_by: engine.pareto_fronts(analyzed, group_by) for group_by in [None, 'Operator', 'BU']}
+
+            entries = {}
+            for strategy in STRATEGIES:
+                scored = analyzed.copy()
+                scored['DIS_Score'] = engine.rescore(analyzed, decision_weights.update_for_strategy(strategy))
+                entries[strategy] = self._build_entry(engine, scored, operators, pareto_ranks)
+
+            with self._lock:
+                if self._stale(version):
+                    return False
+                self.entries = entries
+                self.narratives = {}
+                self.version = version
+                self.stats['warmups'] += 1
+                self.stats['last_warmup_seconds'] = round(time.perf_counter() - start, 3)
+            return True
+
+    def _build_entry(self, engine: DecisionEngine, scored: pd.DataFrame, operators: List[str],
+                     pareto_ranks: Dict) -> Dict:
+        grouped = scored.groupby('Operator')
+        avg_dis = grouped['DIS_Score'].mean()
+        avg_wait = grouped['Wait Time (Hours): ATB-BTR'].mean()
+        bunker = grouped['Bunker Saved (USD)'].sum()
+        carbon = grouped['Carbon Abatement (Tonnes)'].sum()
+        on_time = (scored['Arrival Accuracy (Final BTR)'] == 'Y').groupby(scored['Operator']).mean()
+
+        operator_stats = {}
+        for op in operators:
+            operator_stats[op] = {
+                'avg_dis': round(avg_dis[op], 2),
+                'avg_wait_time': round(avg_wait[op], 2),
+                'total_bunker_saved': round(bunker[op], 2),
+                'total_carbon_abatement': round(carbon[op], 2),
+                'on_time_rate': round(on_time[op] * 100, 1)
+            }
+
+        scopes = {None: scored}
+        scopes.update({op: scored[scored['Operator'] == op] for op in operators})
+
+        top_k, summaries, totals, recommendations, pareto = {}, {}, {}, {}, {}
+        for scope, frame in scopes.items():
+            top_k[scope] = frame.nlargest(self.top_k, 'DIS_Score')[TOP_PERFORMER_COLUMNS]
+            summaries[scope] = engine.summarize(frame.head(self.summary_rows))
+            totals[scope] = engine.summarize(frame)
+            recommendations[scope] = engine.recommendations_from_analyzed(frame)
+            ranks = pareto_ranks[None if scope is None else 'Operator'].loc[frame.index]
+            pareto[scope] = engine.pareto_front(frame, self.top_k, ranks)
+
+        bu_pareto = {
+            bu: engine.pareto_front(frame, self.top_k, pareto_ranks['BU'].loc[frame.index])
+            for bu, frame in scored.groupby('BU')
+        }
+
+        return {
+            'operator_stats': operator_stats,
+            'top_k': top_k,
+            'summaries': summaries,
+            'totals': totals,
+            'recommendations': recommendations,
+            'pareto': pareto,
+            'bu_pareto': bu_pareto,
+            'operator_skyline': engine.skyline_by(scored, 'Operator')
+        }
+
+    def _lookup(self, version: Optional[str], strategy: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self.entries.get(strategy) if self.is_current(version) else None
+            self.stats['hits' if entry is not None else 'misses'] += 1
+            return entry
+
+    def comparison(self, version: Optional[str], strategy: str, operators: List[str]) -> Optional[Dict]:
+        entry = self._lookup(version, strategy)
+        if entry is None or any(op not in entry['operator_stats'] for op in operators):
+            return None
+        return {op: entry['operator_stats'][op] for op in operators}
+
+    def top_performers(self, version: Optional[str], strategy: str, n: int = 5,
+                       operator: Optional[str] = None) -> Optional[pd.DataFrame]:
+        entry = self._lookup(version, strategy)
+        if entry is None or n > self.top_k or operator not in entry['top_k']:
+            return None
+        return entry['top_k'][operator].head(n)
+
+    def pareto(self, version: Optional[str], strategy: str, n: int = 10, operator: Optional[str] = None,
+               bu: Optional[str] = None) -> Optional[Tuple[pd.DataFrame, pd.DataFrame]]:
+        entry = self._lookup(version, strategy)
+        if entry is None or n > self.top_k:
+            return None
+        fronts, scope = (entry['bu_pareto'], bu) if bu else (entry['pareto'], operator)
+        if scope not in fronts:
+            return None
+        return fronts[scope].head(n), entry['operator_skyline']
+
+    def summary(self, version: Optional[str], strategy: str, operator: Optional[str] = None) -> Optional[Dict]:
+        entry = self._lookup(version, strategy)
+        if entry is None or operator not in entry['summaries']:
+            return None
+        return entry['summaries'][operator]
+
+    def totals(self, version: Optional[str], strategy: str, operator: Optional[str] = None) -> Optional[Dict]:
+        entry = self._lookup(version, strategy)
+        if entry is None or operator not in entry['totals']:
+            return None
+        return entry['totals'][operator]
+
+    def recommendations(self, version: Optional[str], strategy: str,
+                        operator: Optional[str] = None) -> Optional[List[str]]:
+        entry = self._lookup(version, strategy)
+        if entry is None or operator not in entry['recommendations']:
+            return None
+        return list(entry['recommendations'][operator])
+
+    def narrative(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            response = self.narratives.get(key)
+            if response is not None:
+                self.stats['narrative_hits'] += 1
+            return dict(response) if response is not None else None
+
+    def store_narrative(self, version: str, key: str, response: Dict):
+        with self._lock:
+            if self.is_current(version) and response.get('success'):
+                self.narratives[key] = response
+                self.stats['narratives'] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, version=self.version, cached_narratives=len(self.narratives))
+
+def pregenerate_narratives(cache: AnswerCache, version: str, llm, prompts: List[Tuple[str, str, str]]) -> threading.Thread:
+    def run():
+        for key, prompt, system_message in prompts:
+            if not cache.is_current(version):
+                return
+            try:
+                cache.store_narrative(version, key, llm.generate_response(prompt, system_message=system_message))
+            except Exception:
+                continue
+
+    thread = threading.Thread(target=run, name="praxis-narrative-warmup", daemon=True)
+    thread.start()
+    return thread